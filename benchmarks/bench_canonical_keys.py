@@ -0,0 +1,90 @@
+"""
+Validation cost per item of BoletoModel, CustomerModel and UserModel, with
+canonicalize_keys reading the introspected inputs against dumping the model.
+
+    PYTHONPATH=. python benchmarks/bench_canonical_keys.py
+"""
+
+import time
+import uuid
+from datetime import date
+
+from ulid import ULID
+
+from incc_shared.models.db.boleto.boleto import BoletoModel
+from incc_shared.models.db.customer import CustomerModel
+from incc_shared.models.db.user.user import UserModel
+
+ITENS = 10_000
+TENANT = f"ORG#{ULID()}"
+
+
+def boleto(i: int):
+    return {
+        "tenant": TENANT,
+        "nossoNumero": i + 1,
+        "valor": "1234.56",
+        "vencimento": date(2025, 1, 10).isoformat(),
+        "emissao": date(2024, 12, 10).isoformat(),
+        "pagador": str(ULID()),
+        "status": ["EMITIDO"],
+        "juros": {"tipo": "TAXA", "valor": "1.00", "prazo": 1},
+        "multa": {"tipo": "TAXA", "valor": "2.00", "prazo": 1},
+    }
+
+
+def customer(i: int):
+    return {
+        "tenant": TENANT,
+        "customerId": str(ULID()),
+        "nome": f"Cliente {i}",
+        "tipoDocumento": "CPF",
+        "documento": "01234567890",
+        "endereco": {
+            "logradouro": "Rua dos Bobos, 0",
+            "bairro": "Centro",
+            "cidade": "Uberlândia",
+            "uf": "MG",
+            "cep": "38400000",
+        },
+    }
+
+
+def user(i: int):
+    return {
+        "tenant": TENANT,
+        "id": str(uuid.uuid4()),
+        "email": f"user{i}@example.com",
+        "features": ["read:org", "write:customer"],
+    }
+
+
+def validate(model, items):
+    start = time.perf_counter()
+    for item in items:
+        model.model_validate(item)
+    return (time.perf_counter() - start) / len(items)
+
+
+def bench(model, build):
+    items = [build(i) for i in range(ITENS)]
+    fast_inputs = model._canonical_inputs
+    validate(model, items[:100])
+
+    model._canonical_inputs = None
+    try:
+        dumped = min(validate(model, items) for _ in range(3))
+    finally:
+        model._canonical_inputs = fast_inputs
+    fast = min(validate(model, items) for _ in range(3))
+
+    print(
+        f"{model.__name__}: {dumped * 1e6:.1f} us -> {fast * 1e6:.1f} us per item "
+        f"({dumped / fast:.2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    bench(BoletoModel, boleto)
+    bench(CustomerModel, customer)
+    bench(UserModel, user)
@@ -0,0 +1,55 @@
+"""
+Month arithmetic of incc_shared.service.utils against relativedelta and
+strftime, over the installments of a 35 year contract.
+
+    PYTHONPATH=. python benchmarks/bench_months.py
+"""
+
+import timeit
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+
+from incc_shared.service.utils import add_months, month_key, month_ordinal
+
+INICIO = date(1994, 1, 31)
+PARCELAS = 420
+REPETICOES = 200
+
+
+def parcelas_relativedelta():
+    return [INICIO + relativedelta(months=i) for i in range(PARCELAS)]
+
+
+def parcelas_add_months():
+    return [add_months(INICIO, i) for i in range(PARCELAS)]
+
+
+def chaves_strftime():
+    mes = INICIO.replace(day=1)
+    chaves = []
+    for _ in range(PARCELAS):
+        chaves.append(mes.strftime("%d/%m/%Y"))
+        mes += relativedelta(months=1)
+    return chaves
+
+
+def chaves_month_key():
+    inicio = month_ordinal(INICIO)
+    return [month_key(inicio + i) for i in range(PARCELAS)]
+
+
+def bench(nome, antes, depois):
+    assert antes() == depois()
+    t_antes = min(timeit.repeat(antes, number=REPETICOES, repeat=5))
+    t_depois = min(timeit.repeat(depois, number=REPETICOES, repeat=5))
+    por_parcela = 1e9 / (REPETICOES * PARCELAS)
+    print(
+        f"{nome}: {t_antes * por_parcela:.0f} ns -> {t_depois * por_parcela:.0f} ns "
+        f"per installment ({t_antes / t_depois:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    bench("due dates", parcelas_relativedelta, parcelas_add_months)
+    bench("index keys", chaves_strftime, chaves_month_key)
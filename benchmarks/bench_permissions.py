@@ -0,0 +1,65 @@
+"""
+Permission check of required_permissions for a user with a few features,
+comparing the linear scan over Feature objects with the compiled masks.
+
+    PYTHONPATH=. python benchmarks/bench_permissions.py
+"""
+
+import timeit
+
+from ulid import ULID
+
+from incc_shared.models.feature import (
+    Feature,
+    PermissionedEntity,
+    Resource,
+    Scope,
+    compile_required,
+)
+
+REPETICOES = 100_000
+
+USER = PermissionedEntity(
+    tenant=f"ORG#{ULID()}",
+    features=[
+        Feature.read(Resource.org),
+        Feature.read(Resource.customer),
+        Feature.write(Resource.customer),
+        Feature.read(Resource.boleto),
+        Feature.write(Resource.schedule, Scope.all),
+    ],
+)
+FEATURE_LIST = [
+    Feature.write(Resource.boleto),
+    Feature.write(Resource.org, Scope.all),
+    Feature.write(Resource.schedule),
+]
+REQUIRED = compile_required(FEATURE_LIST)
+
+
+def linear_scan(feature: Feature):
+    required = feature.scope or Scope.org
+    for f in USER.features:
+        if f.action == feature.action and f.resource == feature.resource:
+            if (f.scope or Scope.org).includes(required):
+                return True
+    return False
+
+
+def scan():
+    return any(linear_scan(f) for f in FEATURE_LIST)
+
+
+def compiled():
+    return USER.has_permissions(REQUIRED, "any")
+
+
+if __name__ == "__main__":
+    assert scan() == compiled()
+    t_scan = min(timeit.repeat(scan, number=REPETICOES, repeat=5))
+    t_compiled = min(timeit.repeat(compiled, number=REPETICOES, repeat=5))
+    por_checagem = 1e9 / REPETICOES
+    print(
+        f"permission check: {t_scan * por_checagem:.0f} ns -> "
+        f"{t_compiled * por_checagem:.0f} ns ({t_scan / t_compiled:.1f}x)"
+    )
@@ -0,0 +1,92 @@
+"""
+Cost per item of turning a query page into models: the table resource
+(TypeDeserializer, normalize_item and model_validate) against storage.codec,
+plus encoding to_item() output with TypeSerializer and with the codec.
+
+    PYTHONPATH=. python benchmarks/bench_query_codec.py
+"""
+
+import os
+import time
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+os.environ.setdefault("DYNAMODB_TABLE", "benchmark")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from bench_canonical_keys import ITENS, customer  # noqa: E402
+from bench_trusted_reads import boleto_de_pagador, stored  # noqa: E402
+
+from incc_shared.models.db.boleto.boleto import BoletoModel  # noqa: E402
+from incc_shared.models.db.customer import CustomerModel  # noqa: E402
+from incc_shared.service.storage import trusted  # noqa: E402
+from incc_shared.service.storage.base import to_model  # noqa: E402
+from incc_shared.service.storage.codec import encode_item, get_codec  # noqa: E402
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+
+def resource_page(items, model):
+    for item in items:
+        to_model({k: deserializer.deserialize(v) for k, v in item.items()}, model)
+
+
+def codec_page(items, model):
+    codec = get_codec(model)
+    for item in items:
+        model.model_validate(codec.decode(item))
+
+
+def resource_trusted_page(items, model):
+    for item in items:
+        values = {k: deserializer.deserialize(v) for k, v in item.items()}
+        trusted.to_trusted_model(values, model)
+
+
+def codec_trusted_page(items, model):
+    codec = get_codec(model)
+    for item in items:
+        trusted.to_trusted_model(codec.decode(item), model)
+
+
+def serialize(items):
+    for item in items:
+        {k: serializer.serialize(v) for k, v in item.items()}
+
+
+def encode(items):
+    for item in items:
+        encode_item(item)
+
+
+def per_item(run, *args):
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        run(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / ITENS
+
+
+def compare(label, old, new, *args):
+    before, after = per_item(old, *args), per_item(new, *args)
+    print(
+        f"{label}: {before * 1e6:.1f} us -> {after * 1e6:.1f} us per item "
+        f"({before / after:.1f}x)"
+    )
+
+
+def bench(model, build_item):
+    items = [stored(model, build_item(i)) for i in range(ITENS)]
+    wire = [{k: serializer.serialize(v) for k, v in i.items()} for i in items]
+    name = model.__name__
+    compare(f"{name} validated", resource_page, codec_page, wire, model)
+    compare(f"{name} trusted", resource_trusted_page, codec_trusted_page, wire, model)
+    compare(f"{name} encode", serialize, encode, items)
+
+
+if __name__ == "__main__":
+    trusted.TRUSTED_READ_SAMPLE_RATE = 0
+    bench(BoletoModel, boleto_de_pagador)
+    bench(CustomerModel, customer)
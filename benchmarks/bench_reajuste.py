@@ -0,0 +1,49 @@
+"""
+Installments of a contract started at the beginning of the INCC history,
+calculated in integer cents against Decimal, using the bundled snapshot.
+
+    PYTHONPATH=. python benchmarks/bench_reajuste.py
+"""
+
+import os
+import timeit
+from decimal import Decimal
+
+os.environ.setdefault("STORAGE_BUCKET", "benchmark")
+
+from incc_shared.service.calculator import (  # noqa: E402
+    IndiceINCC,
+    _parcelas_centavos,
+    _parcelas_decimal,
+)
+from incc_shared.service.incc_snapshot import load_snapshot  # noqa: E402
+
+VALOR = Decimal("1234.56")
+REPETICOES = 200
+
+
+def main():
+    snapshot = load_snapshot()
+    assert snapshot
+    indice = IndiceINCC(snapshot.history)
+    fim = len(indice.incc)
+
+    def decimal():
+        return list(_parcelas_decimal(indice, VALOR, 0, fim))
+
+    def centavos():
+        return list(_parcelas_centavos(indice, VALOR, 0, fim))
+
+    assert decimal() == centavos()
+    t_decimal = min(timeit.repeat(decimal, number=REPETICOES, repeat=5))
+    t_centavos = min(timeit.repeat(centavos, number=REPETICOES, repeat=5))
+    por_parcela = 1e9 / (REPETICOES * fim)
+    print(
+        f"{fim} installments: {t_decimal * por_parcela:.0f} ns -> "
+        f"{t_centavos * por_parcela:.0f} ns per installment "
+        f"({t_decimal / t_centavos:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Throughput of turning models into items for a bulk create, with
+model_dump(mode="json") against the compiled to_item serializers, with and
+without the TypeSerializer pass boto3 makes before sending them.
+
+    PYTHONPATH=. python benchmarks/bench_to_item.py
+"""
+
+import time
+
+from bench_canonical_keys import ITENS, customer, user
+from bench_trusted_reads import boleto_de_pagador
+from boto3.dynamodb.types import TypeSerializer
+
+from incc_shared.models.db.boleto.boleto import BoletoModel
+from incc_shared.models.db.customer import CustomerModel
+from incc_shared.models.db.user.user import UserModel
+
+REPETICOES = 7
+
+serializer = TypeSerializer()
+
+
+def model_dump(model):
+    return model.model_dump(mode="json", exclude_none=True)
+
+
+def to_item(model):
+    return model.to_item()
+
+
+def throughput(convert, models, serialize):
+    best = float("inf")
+    for _ in range(REPETICOES):
+        start = time.perf_counter()
+        for model in models:
+            item = convert(model)
+            if serialize:
+                {k: serializer.serialize(v) for k, v in item.items()}
+        best = min(best, time.perf_counter() - start)
+    return len(models) / best
+
+
+def bench(model, build_item):
+    models = [model.model_validate(build_item(i)) for i in range(ITENS)]
+    for serialize in (False, True):
+        before = throughput(model_dump, models, serialize)
+        after = throughput(to_item, models, serialize)
+        label = "to_item + TypeSerializer" if serialize else "to_item"
+        print(
+            f"{model.__name__} {label}: {before:,.0f} -> {after:,.0f} items/s "
+            f"({after / before:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    bench(BoletoModel, boleto_de_pagador)
+    bench(CustomerModel, customer)
+    bench(UserModel, user)
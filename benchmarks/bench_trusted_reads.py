@@ -0,0 +1,63 @@
+"""
+Cost per item of building BoletoModel, CustomerModel and UserModel from the
+items read from DynamoDB, with to_model and with the trusted read coercers.
+
+    PYTHONPATH=. python benchmarks/bench_trusted_reads.py
+"""
+
+import json
+import os
+import time
+from decimal import Decimal
+
+from ulid import ULID
+
+os.environ.setdefault("DYNAMODB_TABLE", "benchmark")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from bench_canonical_keys import ITENS, boleto, customer, user  # noqa: E402
+
+from incc_shared.models.db.boleto.boleto import BoletoModel  # noqa: E402
+from incc_shared.models.db.customer import CustomerModel  # noqa: E402
+from incc_shared.models.db.user.user import UserModel  # noqa: E402
+from incc_shared.service.storage import trusted  # noqa: E402
+from incc_shared.service.storage.base import to_model  # noqa: E402
+
+# Lists hold many boletos of the same payers
+PAGADORES = [str(ULID()) for _ in range(100)]
+
+
+def boleto_de_pagador(i: int):
+    item = boleto(i)
+    item["pagador"] = PAGADORES[i % len(PAGADORES)]
+    return item
+
+
+def stored(model, item):
+    """The item as the table resource returns it, numbers as Decimal"""
+    dumped = json.dumps(model.model_validate(item).to_item())
+    return json.loads(dumped, parse_int=Decimal, parse_float=Decimal)
+
+
+def build(convert, model, items):
+    start = time.perf_counter()
+    for item in items:
+        convert(item, model)
+    return (time.perf_counter() - start) / len(items)
+
+
+def bench(model, build_item):
+    items = [stored(model, build_item(i)) for i in range(ITENS)]
+    validated = min(build(to_model, model, items) for _ in range(3))
+    fast = min(build(trusted.to_trusted_model, model, items) for _ in range(3))
+    print(
+        f"{model.__name__}: {validated * 1e6:.1f} us -> {fast * 1e6:.1f} us per item "
+        f"({validated / fast:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    trusted.TRUSTED_READ_SAMPLE_RATE = 0
+    bench(BoletoModel, boleto_de_pagador)
+    bench(CustomerModel, customer)
+    bench(UserModel, user)
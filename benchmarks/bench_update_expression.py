@@ -0,0 +1,60 @@
+"""
+Building the update_item arguments of a schedule update, like the executor
+does after each emission, with the UpdateExpression built on every call
+against compiled once per path shape.
+
+    PYTHONPATH=. python benchmarks/bench_update_expression.py
+"""
+
+import os
+import timeit
+import uuid
+from datetime import date
+from decimal import Decimal
+
+os.environ.setdefault("DYNAMODB_TABLE", "benchmark")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from ulid import ULID  # noqa: E402
+
+from incc_shared.auth.context import set_context_entity  # noqa: E402
+from incc_shared.models.db.user.user import UserModel  # noqa: E402
+from incc_shared.service.storage import dynamodb  # noqa: E402
+
+REPETICOES = 20_000
+
+
+def update():
+    return {
+        "parcelasEmitidas": 12,
+        "proximaExecucao": date(2025, 2, 1).isoformat(),
+        "status": "ATIVO",
+        "valorBase": Decimal("1234.56"),
+    }
+
+
+def build():
+    dynamodb._build_update_args(update(), ["proximaExecucao"])
+
+
+def per_call():
+    return min(timeit.repeat(build, number=REPETICOES, repeat=5)) / REPETICOES
+
+
+if __name__ == "__main__":
+    set_context_entity(
+        UserModel(
+            tenant=f"ORG#{ULID()}", id=str(uuid.uuid4()), email="bench@example.com"
+        )
+    )
+    compiled = dynamodb._compile_update_expression
+    dynamodb._compile_update_expression = compiled.__wrapped__
+    try:
+        antes = per_call()
+    finally:
+        dynamodb._compile_update_expression = compiled
+    depois = per_call()
+    print(
+        f"_build_update_args: {antes * 1e6:.2f} us -> {depois * 1e6:.2f} us "
+        f"({antes / depois:.1f}x)"
+    )
@@ -1,31 +1,56 @@
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextvars import copy_context
 from datetime import date
-from typing import Any, Dict, List
+from decimal import Decimal
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Optional
 
-from dateutil.relativedelta import relativedelta
+from ulid import ULID
 
-from incc_shared.admin.service.schedule import list_schedules_for_date
+from incc_shared.admin.service.schedule import iter_schedules_for_date
 from incc_shared.auth.context import impersonate
 from incc_shared.constants import EntityType
-from incc_shared.exceptions.errors import IdempotencyError, InvalidState
+from incc_shared.exceptions.errors import InvalidState, TransactionCanceled
 from incc_shared.models import ConstrainedMoney
-from incc_shared.models.db.boleto.base import StatusBoleto
 from incc_shared.models.db.indexes.schedule import ScheduleIndexModel
+from incc_shared.models.db.organization import OrganizationModel
 from incc_shared.models.db.schedule.base import ScheduleStatus
 from incc_shared.models.request.boleto.create import CreateBoletoModel
 from incc_shared.models.request.schedule.update import UpdateScheduleModel
-from incc_shared.service.boleto import create_boleto, get_boleto
+from incc_shared.service.boleto import build_boleto_model
 from incc_shared.service.calculator import (
     calcula_valor,
-    formata_data_indice,
+    calcula_valores,
     get_incc_map,
 )
 from incc_shared.service.organization import get_org
-from incc_shared.service.schedule import update_schedule
-from incc_shared.service.storage.dynamodb import acquire_idempotency_lock
+from incc_shared.service.storage.dynamodb import (
+    create_operation,
+    get_dynamo_key,
+    idempotency_lock_operation,
+    transact_write_dynamo_items,
+    update_operation,
+)
+from incc_shared.service.utils import add_months, month_date, month_key, month_ordinal
+
+CONDITION_FAILED = "ConditionalCheckFailed"
+TRANSACTION_CONFLICT = "TransactionConflict"
+MAX_TRANSACTION_ATTEMPTS = 3
 
 
 class ScheduleFailed(Exception):
-    pass
+    failures: Dict[ULID, List[Dict[str, Any]]]
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        total = sum(len(f) for f in self.failures.values())
+        super().__init__(f"{total} schedules failed in {len(self.failures)} orgs")
 
 
 def validate_schedule(schedule: ScheduleIndexModel):
@@ -59,21 +84,41 @@ def valor_reajustado(valor_base: ConstrainedMoney, data_inicio: date):
 
 
 def get_data_indice():
-    return date.today().replace(day=1) - relativedelta(months=1)
+    return month_date(month_ordinal(date.today()) - 1)
 
 
 def get_indice_reajuste():
     mapa_incc = get_incc_map()
-    return mapa_incc[formata_data_indice(get_data_indice())]
-
-
-def run_schedule(schedule: ScheduleIndexModel, nosso_numero: int):
+    return mapa_incc[month_key(month_ordinal(date.today()) - 1)]
+
+
+def valores_reajustados(schedules: List[ScheduleIndexModel]):
+    """valor_reajustado for many schedules, sharing the calculation per month"""
+    pares = [(s.valorBase, s.dataInicio) for s in schedules]
+    return calcula_valores(pares, data_fim=date.today())
+
+
+def run_schedule(
+    schedule: ScheduleIndexModel,
+    org: OrganizationModel,
+    valor: Optional[Decimal] = None,
+):
+    """
+    Issues the next boleto of the schedule in a single transaction: the
+    idempotency lock, the boleto, the org nossoNumero bump and the schedule
+    advance are either all written or none is. org.nossoNumero is used as the
+    next number and is kept up to date, so it can be reused for the org's
+    following schedules. valor is the adjusted value, when already calculated.
+    Returns the nossoNumero of the issued boleto, or None if it was already
+    issued.
+    """
     # 1. validate consistency of fields
     validate_schedule(schedule)
 
-    # 2. In an idempotent way, create a boleto
-    valor = valor_reajustado(schedule.valorBase, schedule.dataInicio)
-    vencimento = schedule.vencimento + relativedelta(months=schedule.parcelasEmitidas)
+    # 2. Build the boleto and the schedule advance
+    if valor is None:
+        valor = valor_reajustado(schedule.valorBase, schedule.dataInicio)
+    vencimento = add_months(schedule.vencimento, schedule.parcelasEmitidas)
     parcela_atual = schedule.parcelasEmitidas + 1
     boleto_data = {
         "valor": valor,
@@ -87,36 +132,6 @@ def run_schedule(schedule: ScheduleIndexModel, nosso_numero: int):
     }
     boleto = CreateBoletoModel(**boleto_data)
 
-    boleto_entity = f"BOLETO#{nosso_numero}"
-    lock_key = f"{schedule.id}#{parcela_atual}"
-    lock_metadata = {"nossoNumero": nosso_numero, "scheduleId": schedule.to_item()}
-    try:
-        acquire_idempotency_lock(
-            EntityType.boleto, lock_key, boleto_entity, lock_metadata
-        )
-        create_boleto(boleto)
-    except IdempotencyError as e:
-        print(
-            f"Failed to acquire lock while running schedule {schedule.id}. Checking if it already exists"
-        )
-        metadata = e.metadata
-        if not metadata:
-            raise InvalidState("Failed to create boleto, and to check its existance")
-        existing_id = metadata.get("nossoNumero")
-        if not existing_id or existing_id != nosso_numero:
-            raise InvalidState(
-                f"Lock contains invalid boleto id - expected: {nosso_numero} actual: {existing_id}"
-            )
-
-        existing_boleto = get_boleto(existing_id)
-        if existing_boleto and StatusBoleto.emitido in existing_boleto.status:
-            print("Boleto already issued")
-            return
-
-        print("Boleto likely failed to issue. Trying again")
-        create_boleto(boleto)
-
-    # 3. Update schedule data
     new_schedule_data: Dict[str, Any] = {
         "parcelasEmitidas": parcela_atual,
     }
@@ -126,15 +141,75 @@ def run_schedule(schedule: ScheduleIndexModel, nosso_numero: int):
         proxima_execucao = None
     else:
         current_date = date.today()
-        proxima_execucao = current_date + relativedelta(
-            months=schedule.intervaloParcelas
-        )
+        proxima_execucao = add_months(current_date, schedule.intervaloParcelas)
         new_schedule_data["proximaExecucao"] = proxima_execucao
 
     new_schedule = UpdateScheduleModel(**new_schedule_data)
-    update_schedule(
-        schedule.id, new_schedule, remove_from_index=proxima_execucao is None
-    )
+    remove_paths = ["proximaExecucao"] if proxima_execucao is None else []
+    schedule_key = get_dynamo_key(EntityType.schedule, schedule.id)
+    org_key = get_dynamo_key(EntityType.organization, org.orgId)
+    lock_key = f"{schedule.id}#{parcela_atual}"
+
+    # 3. Write everything at once, retrying when nossoNumero was taken or
+    # another write conflicted
+    for _ in range(MAX_TRANSACTION_ATTEMPTS):
+        nosso_numero = org.nossoNumero
+        model = build_boleto_model(boleto, nosso_numero, org.defaults)
+        lock_metadata = {"nossoNumero": nosso_numero, "scheduleId": schedule.to_item()}
+        operations = [
+            idempotency_lock_operation(
+                EntityType.boleto, lock_key, model.entity, lock_metadata
+            ),
+            create_operation(model.to_item()),
+            update_operation(
+                org_key,
+                {"nossoNumero": nosso_numero + 1},
+                expected={"nossoNumero": nosso_numero},
+            ),
+            update_operation(
+                schedule_key,
+                new_schedule.to_item(),
+                remove_paths=remove_paths,
+                expected={"parcelasEmitidas": schedule.parcelasEmitidas},
+            ),
+        ]
+
+        try:
+            transact_write_dynamo_items(operations)
+            org.nossoNumero = nosso_numero + 1
+            return nosso_numero
+        except TransactionCanceled as e:
+            # Without one reason per operation there is nothing to go by
+            if len(e.reasons) != len(operations):
+                raise
+            lock, boleto_reason, counter, schedule_reason = e.reasons
+            if lock["Code"] == CONDITION_FAILED:
+                print(f"Boleto for schedule {schedule.id} was already issued")
+                return None
+
+            if counter["Code"] == CONDITION_FAILED and counter["Item"]:
+                org.nossoNumero = int(counter["Item"]["nossoNumero"])
+                print(f"nossoNumero {nosso_numero} was taken, retrying")
+                continue
+
+            if boleto_reason["Code"] == CONDITION_FAILED:
+                raise InvalidState(
+                    f"Boleto {nosso_numero} already exists but the org counter points to it"
+                ) from e
+
+            if schedule_reason["Code"] == CONDITION_FAILED:
+                raise InvalidState(
+                    f"Schedule {schedule.id} changed while it was being executed"
+                ) from e
+
+            # Another request was writing one of the items, nothing is wrong
+            # with the transaction itself
+            if any(r["Code"] == TRANSACTION_CONFLICT for r in e.reasons):
+                print(f"Transaction for schedule {schedule.id} conflicted, retrying")
+                continue
+            raise
+
+    raise InvalidState(f"Could not issue the boleto of schedule {schedule.id}")
 
 
 def group_by_org(schedule_list: List[ScheduleIndexModel]):
@@ -148,13 +223,22 @@ def group_by_org(schedule_list: List[ScheduleIndexModel]):
     return schedules
 
 
-def execute_schedules():
-    # 1. Get the list of schedules
-    schedule_list = list_schedules_for_date(date.today())
-    schedules = group_by_org(schedule_list)
-    failed_schedules = {}
-    # 2. For each schedule run it
-    for org_id, org_schedules in schedules.items():
+def iter_by_org(schedules: Iterable[ScheduleIndexModel]):
+    """
+    Groups a stream of schedules already ordered by org, such as the ones from
+    the schedule index, holding only one org's schedules in memory at a time.
+    """
+    for org_id, org_schedules in groupby(schedules, key=lambda s: s.orgId):
+        yield org_id, list(org_schedules)
+
+
+def run_org_schedules(org_id: ULID, org_schedules: List[ScheduleIndexModel]):
+    """
+    Runs the schedules of a single org, in order, as nossoNumero must be handed
+    out serially within an org. Returns the failed schedules.
+    """
+    failures = []
+    try:
         with impersonate(org_id):
             org = get_org()
             if not org:
@@ -163,24 +247,93 @@ def execute_schedules():
             if org.orgId != org_id:
                 raise InvalidState("Failed to impersonate org")
 
-            nosso_numero = org.nossoNumero
-            for s in org_schedules:
+            try:
+                valores = valores_reajustados(org_schedules)
+            except InvalidState:
+                # Let each schedule fail on its own
+                valores = [None] * len(org_schedules)
+
+            for s, valor in zip(org_schedules, valores):
                 try:
-                    run_schedule(s, nosso_numero)
-                    nosso_numero += 1
+                    run_schedule(s, org, valor)
                 except Exception as e:
-                    orgId = s.orgId
                     print(f"Failed to run schedule: {e}")
-                    if orgId not in failed_schedules:
-                        failed_schedules[orgId] = []
+                    failures.append({"schedule_id": s.id, "reason": e})
+    except Exception as e:
+        print(f"Failed to run schedules for org {org_id}: {e}")
+        failed_ids = {f["schedule_id"] for f in failures}
+        failures += [
+            {"schedule_id": s.id, "reason": e}
+            for s in org_schedules
+            if s.id not in failed_ids
+        ]
+    return failures
+
+
+def _run_in_pool(org_groups, max_workers: int):
+    """
+    Runs each org in a worker thread, with a copy of the caller's context so
+    the impersonation rights are carried over. At most 2 * max_workers orgs are
+    kept in flight, so the schedules are still streamed.
+
+    boto3 resources (the storage table) are not thread safe, so the workers
+    only reach DynamoDB through clients, which are: item reads and
+    transactions use dynamodb.meta.client. The schedules are read from the
+    index in this thread. The item cache and the INCC history cache are
+    locked.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending: Dict[Future, ULID] = {}
+        for org_id, org_schedules in org_groups:
+            if len(pending) >= 2 * max_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+
+            context = copy_context()
+            future = pool.submit(context.run, run_org_schedules, org_id, org_schedules)
+            pending[future] = org_id
+
+        for future in as_completed(pending):
+            yield pending[future], future.result()
+
+
+def execute_schedules(
+    page_size: Optional[int] = None,
+    max_workers: int = 1,
+    shard: Optional[int] = None,
+    total_shards: Optional[int] = None,
+):
+    """
+    Runs all schedules due today. With max_workers > 1, different orgs are
+    processed concurrently, each one by a single worker. With shard and
+    total_shards, only the orgs of that shard are run, so a coordinator can fan
+    out the day to total_shards independent workers.
+    """
+    # 1. Stream the schedules, one org at a time
+    schedules = iter_schedules_for_date(
+        date.today(), page_size=page_size, shard=shard, total_shards=total_shards
+    )
+    org_groups = iter_by_org(schedules)
+
+    # 2. For each org run its schedules
+    if max_workers > 1:
+        results = _run_in_pool(org_groups, max_workers)
+    else:
+        results = (
+            (org_id, run_org_schedules(org_id, org_schedules))
+            for org_id, org_schedules in org_groups
+        )
+
+    failed_schedules = {}
+    for org_id, failures in results:
+        if failures:
+            failed_schedules[org_id] = failures
+
+    raise_for_failures(failed_schedules)
 
-                    failed_schedules[orgId].append(
-                        {
-                            "schedule_id": s.id,
-                            "reason": e,
-                        }
-                    )
 
+def raise_for_failures(failed_schedules: Dict[Any, List[Dict[str, Any]]]):
     if failed_schedules:
         total = 0
         print("Summary:")
@@ -189,4 +342,28 @@ def execute_schedules():
             print(f"- {org}: failed {failed} schedules")
             total += failed
         print(f"Total: {total}")
-        raise ScheduleFailed()
+        raise ScheduleFailed(failed_schedules)
+
+
+def failure_report(e: ScheduleFailed) -> Dict[str, List[Dict[str, str]]]:
+    """JSON friendly version of the failures, for shard workers to send back"""
+    return {
+        str(org_id): [
+            {"schedule_id": str(f["schedule_id"]), "reason": str(f["reason"])}
+            for f in failures
+        ]
+        for org_id, failures in e.failures.items()
+    }
+
+
+def merge_failure_reports(reports: Iterable[Dict[str, List[Dict[str, str]]]]):
+    """
+    Merges the failure reports of all shards. Raises ScheduleFailed with the
+    merged report if any schedule failed.
+    """
+    merged: Dict[str, List[Dict[str, str]]] = {}
+    for report in reports:
+        for org_id, failures in report.items():
+            merged.setdefault(org_id, []).extend(failures)
+
+    raise_for_failures(merged)
@@ -1,19 +1,51 @@
+import zlib
 from datetime import date
+from typing import Optional
 
 from boto3.dynamodb.conditions import Attr, Key
 
 from incc_shared.models.db.indexes.schedule import ScheduleIndexModel
 from incc_shared.models.db.schedule.base import ScheduleStatus
-from incc_shared.service.storage.dynamodb import list_dynamo_items
+from incc_shared.service.storage.dynamodb import iter_dynamo_items
 from incc_shared.service.utils import format_date
 
 
-def list_schedules_for_date(target_date: date):
+def shard_of(gsi_org_sk: str, total_shards: int) -> int:
+    """Stable across processes, unlike hash(), so every worker agrees on it"""
+    return zlib.crc32(gsi_org_sk.encode("utf-8")) % total_shards
+
+
+def iter_schedules_for_date(
+    target_date: date,
+    page_size: Optional[int] = None,
+    shard: Optional[int] = None,
+    total_shards: Optional[int] = None,
+):
+    """
+    Schedules are yielded ordered by org, as gsi_org_sk is the index range key.
+    When sharded, only the schedules of the orgs in the given shard are yielded,
+    so all of an org's schedules always land on the same shard.
+    """
+    if (shard is None) != (total_shards is None):
+        raise ValueError("shard and total_shards must be given together")
+    if total_shards is not None and not 0 <= shard < total_shards:
+        raise ValueError(f"Shard {shard} is out of range for {total_shards} shards")
+
     condition = Key("proximaExecucao").eq(format_date(target_date))
     filter = Attr("status").eq(ScheduleStatus.ativo.value)
-    return list_dynamo_items(
+    schedules = iter_dynamo_items(
         condition,
         ScheduleIndexModel,
+        page_size=page_size,
+        trusted=True,
         IndexName="schedule_index",
         FilterExpression=filter,
     )
+    if total_shards is None:
+        return schedules
+
+    return (s for s in schedules if shard_of(s.gsi_org_sk, total_shards) == shard)
+
+
+def list_schedules_for_date(target_date: date):
+    return list(iter_schedules_for_date(target_date))
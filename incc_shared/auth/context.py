@@ -7,6 +7,7 @@ from incc_shared.exceptions.errors import InvalidState, PermissionDenied
 from incc_shared.models.db.indexes.user_index import UserIndexModel
 from incc_shared.models.db.user.user import UserModel
 from incc_shared.models.feature import Feature, Resource, Scope
+from incc_shared.service.storage.identity_map import unit_of_work
 
 _current_actor: ContextVar[UserModel | UserIndexModel | None] = ContextVar(
     "entity", default=None
@@ -45,6 +46,8 @@ def impersonate(org_id: ULID):
     set_context_entity(impersonated)
 
     try:
-        yield
+        # The impersonated org reads its items in a unit of work of its own
+        with unit_of_work():
+            yield
     finally:
         set_context_entity(prev)
@@ -2,18 +2,13 @@ import traceback
 from functools import wraps
 from typing import List, Literal
 
-import cognitojwt
 from cognitojwt.exceptions import CognitoJWTException
 
-from incc_shared.auth.constants import (
-    COGNITO_REGION,
-    get_cognito_client_id,
-    get_cognito_pool_id,
-)
 from incc_shared.auth.context import set_context_entity
+from incc_shared.auth.tokens import verify_token
 from incc_shared.exceptions.http import Forbidden, Unauthorized
 from incc_shared.handler.http import create_response
-from incc_shared.models.feature import Feature
+from incc_shared.models.feature import Feature, compile_required
 from incc_shared.service.user import get_user_by_username
 
 
@@ -22,6 +17,7 @@ def required_permissions(
 ):
     if match not in {"any", "all"}:
         raise ValueError(f"Match type of {match!r} is not valid")
+    required = compile_required(feature_list)
 
     def decorator(func):
         @wraps(func)
@@ -40,12 +36,7 @@ def required_permissions(
                     raise Unauthorized("Ivalid token")
 
                 # Token must be verified
-                verified = cognitojwt.decode(
-                    token,
-                    COGNITO_REGION,
-                    get_cognito_pool_id(),
-                    app_client_id=get_cognito_client_id(),
-                )
+                verified = verify_token(token)
 
                 # User must exist in database (fully registered)
                 user = get_user_by_username(verified["username"])
@@ -54,12 +45,7 @@ def required_permissions(
                     raise Unauthorized()
 
                 # User must have permission
-                if match == "all":
-                    ok = all(user.has_permission(f) for f in feature_list)
-                elif match == "any":
-                    ok = any(user.has_permission(f) for f in feature_list)
-
-                if not ok:
+                if not user.has_permissions(required, match):
                     raise Forbidden("Invalid permissions")
 
                 set_context_entity(user)
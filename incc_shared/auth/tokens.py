@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from cognitojwt.constants import PUBLIC_KEYS_URL_TEMPLATE
+from cognitojwt.exceptions import CognitoJWTException
+from cognitojwt.token_utils import (
+    check_client_id,
+    check_expired,
+    get_unverified_claims,
+    get_unverified_headers,
+)
+from jose import jwk
+from jose.utils import base64url_decode
+
+from incc_shared.auth.constants import (
+    COGNITO_REGION,
+    get_cognito_client_id,
+    get_cognito_pool_id,
+)
+from incc_shared.service.cache import TTLCache
+
+JWKS_TIMEOUT = 5  # seconds
+# Minimum time between JWKS fetches triggered by unknown kids, so tokens signed
+# with made up kids can't make every request fetch the keys again
+JWKS_MIN_REFRESH_INTERVAL = 60  # seconds
+VERIFIED_TOKEN_CACHE_SIZE = 1024
+
+
+def get_jwks_url() -> str:
+    return os.environ.get("AWS_COGNITO_JWKS_PATH") or PUBLIC_KEYS_URL_TEMPLATE.format(
+        COGNITO_REGION, get_cognito_pool_id()
+    )
+
+
+def fetch_jwks(url: str) -> List[Dict[str, Any]]:
+    if url.startswith("http"):
+        response = requests.get(url, timeout=JWKS_TIMEOUT)
+        response.raise_for_status()
+        return response.json().get("keys", [])
+
+    with open(url) as f:
+        return json.load(f).get("keys", [])
+
+
+class JWKSCache:
+    """
+    Public keys of the user pool, by kid. The keys are fetched on first use
+    and again when a token is signed with an unknown kid, which is how key
+    rotation shows up.
+    """
+
+    def __init__(self, url: str, fetch: Callable[[str], List[dict]] = fetch_jwks):
+        self.url = url
+        self.fetch = fetch
+        self.keys: Dict[str, Any] = {}
+        self.fetched_at: Optional[float] = None
+        self.fetches = 0
+        self._lock = threading.Lock()
+
+    def get_key(self, kid: str):
+        key = self.keys.get(kid)
+        if key is not None:
+            return key
+
+        with self._lock:
+            key = self.keys.get(kid)
+            if key is None and self._can_refresh():
+                self.refresh()
+                key = self.keys.get(kid)
+
+        if key is None:
+            raise CognitoJWTException("Public key not found in jwks.json")
+        return key
+
+    def _can_refresh(self):
+        if self.fetched_at is None:
+            return True
+        return time.monotonic() - self.fetched_at >= JWKS_MIN_REFRESH_INTERVAL
+
+    def refresh(self):
+        keys = self.fetch(self.url)
+        self.keys = {k["kid"]: jwk.construct(k) for k in keys}
+        self.fetched_at = time.monotonic()
+        self.fetches += 1
+
+
+jwks_cache: Optional[JWKSCache] = None
+verified_tokens: TTLCache[Dict[str, Any]] = TTLCache(VERIFIED_TOKEN_CACHE_SIZE, ttl=0)
+
+
+def get_jwks() -> JWKSCache:
+    global jwks_cache
+
+    url = get_jwks_url()
+    if jwks_cache is None or jwks_cache.url != url:
+        jwks_cache = JWKSCache(url)
+    return jwks_cache
+
+
+def verify_token(token: str) -> Dict[str, Any]:
+    """
+    Same checks as cognitojwt.decode, with the keys from the JWKS cache.
+    Verified tokens are kept until they expire, so later requests with the
+    same token skip the signature verification.
+    """
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    claims = verified_tokens.get(token_hash)
+    if claims is not None:
+        check_expired(claims["exp"])
+        return dict(claims)
+
+    message, encoded_signature = token.rsplit(".", 1)
+    signature = base64url_decode(encoded_signature.encode("utf-8"))
+    kid = get_unverified_headers(token)["kid"]
+    public_key = get_jwks().get_key(kid)
+    if not public_key.verify(message.encode("utf-8"), signature):
+        raise CognitoJWTException("Signature verification failed")
+
+    claims = get_unverified_claims(token)
+    check_expired(claims["exp"])
+    check_client_id(claims, get_cognito_client_id())
+
+    verified_tokens.put(token_hash, claims, ttl=claims["exp"] - time.time())
+    return dict(claims)
@@ -33,6 +33,14 @@ class PermissionDenied(AppError):
         super().__init__(code="permission_denied", message=message)
 
 
+class TransactionCanceled(AppError):
+    reasons: list[dict[str, Any]]
+
+    def __init__(self, message="Transaction canceled", reasons=None):
+        super().__init__(code="transaction_canceled", message=message)
+        self.reasons = reasons or []
+
+
 class IdempotencyError(AppError):
     metadata: Optional[dict[str, Any]]
 
@@ -7,12 +7,17 @@ from pydantic import ValidationError
 from incc_shared.exceptions.errors import AppError, InvalidState
 from incc_shared.exceptions.http import BadRequest, Forbidden, Unauthorized
 from incc_shared.handler.http import create_response
+from incc_shared.service.storage.identity_map import unit_of_work
 
 
 def handler(model=None):
     def decorator(func):
         @wraps(func)
         def wrapper(event, context, *args, **kwargs):
+            with unit_of_work():
+                return handle(event, context, *args, **kwargs)
+
+        def handle(event, context, *args, **kwargs):
             try:
                 if not model:
                     return func(event, context, *args, **kwargs)
@@ -1,12 +1,19 @@
 from datetime import datetime
-from typing import Any, ClassVar, Dict, Optional, Type
+from string import Formatter
+from typing import Any, ClassVar, Dict, Optional, Tuple, Type
 
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 
+from incc_shared.models.serializer import get_serializer
+
 
 class DynamoSerializableModel(BaseModel):
     def to_item(self, exclude_none: bool = True) -> Dict[str, Any]:
-        return self.model_dump(mode="json", exclude_none=exclude_none)
+        """
+        The model as a DynamoDB item, like model_dump(mode="json") but with
+        Decimals kept as Decimal, so they are stored as numbers
+        """
+        return get_serializer(type(self))(self, exclude_none)
 
     @classmethod
     def from_item(
@@ -15,6 +22,10 @@ class DynamoSerializableModel(BaseModel):
         return cls(**item)
 
 
+def _declaring_class(cls: type, name: str) -> type:
+    return next(c for c in cls.__mro__ if name in c.__dict__)
+
+
 class DynamoBaseModel(DynamoSerializableModel):
     """
     Base model for DynamoDB items.
@@ -23,6 +34,9 @@ class DynamoBaseModel(DynamoSerializableModel):
     - ENTITY_TEMPLATE: format strings using placeholders like {orgId}, {userId}
     - compute_additional_gsis(cls, values) -> Dict[str, Optional[str]]:
          return a dict of additional gsi field names -> values
+    - GSI_INPUTS: names of the values compute_additional_gsis reads. When a
+      subclass overrides compute_additional_gsis without declaring them, the
+      whole model is dumped to build the values.
     """
 
     # canonical key fields that commonly exist; subclasses may or may not use them
@@ -35,12 +49,45 @@ class DynamoBaseModel(DynamoSerializableModel):
     updatedBy: Optional[str] = Field(
         None, description="Entidade que atualizou o recurso"
     )
+    version: Optional[int] = Field(
+        None, description="Incrementado a cada escrita do recurso"
+    )
 
     model_config = ConfigDict(populate_by_name=True)
 
     # --- subclass override points ---
     # Template example: "USER#{userId}"
     ENTITY_TEMPLATE: ClassVar[Optional[str]] = None
+    GSI_INPUTS: ClassVar[Optional[Tuple[str, ...]]] = None
+
+    # Attributes canonicalize_keys reads, or None when it must dump the model
+    _canonical_inputs: ClassVar[Optional[Tuple[str, ...]]] = None
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any):
+        super().__pydantic_init_subclass__(**kwargs)
+
+        # GSI_INPUTS only applies to the compute_additional_gsis declared with
+        # it or before it
+        gsis_owner = _declaring_class(cls, "compute_additional_gsis")
+        inputs_owner = _declaring_class(cls, "GSI_INPUTS")
+        if gsis_owner is not DynamoBaseModel and (
+            cls.GSI_INPUTS is None or not issubclass(inputs_owner, gsis_owner)
+        ):
+            cls._canonical_inputs = None
+            return
+
+        names = ["entity", *(cls.GSI_INPUTS or ())]
+        if cls.ENTITY_TEMPLATE:
+            for _, field_name, _, _ in Formatter().parse(cls.ENTITY_TEMPLATE):
+                if field_name:
+                    names.append(field_name.split(".")[0].split("[")[0])
+
+        # Like in model_dump, names that are not fields are left out
+        attributes = {**cls.model_fields, **cls.model_computed_fields}
+        cls._canonical_inputs = tuple(
+            n for n in dict.fromkeys(names) if n in attributes
+        )
 
     @classmethod
     def compute_sk(cls, values: Dict[str, Any]) -> Optional[str]:
@@ -69,7 +116,11 @@ class DynamoBaseModel(DynamoSerializableModel):
         and compute_additional_gsis. Does NOT raise for mismatches by default -
         it prefers authoritative computed values.
         """
-        values = self.model_dump()
+        inputs = self.__class__._canonical_inputs
+        if inputs is None:
+            values = self.model_dump()
+        else:
+            values = {name: getattr(self, name) for name in inputs}
 
         # Compute entity if template provided
         self.entity = self.__class__.compute_sk(values)
@@ -12,6 +12,7 @@ from incc_shared.models.db.schedule.base import ScheduleStatus
 class ScheduleIndexModel(DynamoSerializableModel):
     tenant: str
     entity: str
+    gsi_org_sk: str
 
     proximaExecucao: date
     valorBase: ConstrainedMoney
@@ -1,4 +1,4 @@
-from typing import Any, ClassVar, Dict, Optional
+from typing import Any, ClassVar, Dict, Optional, Tuple
 
 from incc_shared.models.base import DynamoBaseModel
 from incc_shared.models.db.user.base import UserBase
@@ -7,6 +7,7 @@ from incc_shared.models.feature import PermissionedEntity
 
 class UserModel(UserBase, DynamoBaseModel, PermissionedEntity):
     ENTITY_TEMPLATE: ClassVar[Optional[str]] = "USER#{id}"
+    GSI_INPUTS: ClassVar[Optional[Tuple[str, ...]]] = ("userId", "email", "orgId")
 
     gsi_user_pk: Optional[str] = None
     gsi_email_pk: Optional[str] = None
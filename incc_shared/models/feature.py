@@ -1,9 +1,11 @@
 from enum import Enum
 from functools import cached_property
-from typing import List, Optional, Tuple, overload
+from typing import Iterable, List, Optional, Tuple, overload
 
 from pydantic import (
+    ConfigDict,
     Field,
+    PrivateAttr,
     ValidationError,
     computed_field,
     field_serializer,
@@ -33,17 +35,57 @@ class Scope(str, Enum):
 
     @property
     def level(self) -> int:
-        order = {
-            Scope.org: 1,
-            Scope.all: 2,
-        }
-        return order[self]
+        return SCOPE_LEVELS[self]
 
     def includes(self, required: "Scope"):
         return self.level >= required.level
 
 
+SCOPE_LEVELS = {
+    Scope.org: 1,
+    Scope.all: 2,
+}
+
+# Each (action, resource, scope) gets a bit, so a set of features compiles to
+# an integer and permission checks are bitwise operations
+_PERMISSION_BITS = {
+    (action, resource, scope): 1 << i
+    for i, (action, resource, scope) in enumerate(
+        (a, r, s) for a in Action for r in Resource for s in Scope
+    )
+}
+
+
+def permission_bit(
+    action: Action, resource: Resource, scope: Optional[Scope] = None
+) -> int:
+    """Bit of the permission required by (action, resource, scope)"""
+    return _PERMISSION_BITS[(action, resource, scope or Scope.org)]
+
+
+def compile_granted(features: Iterable["Feature"]) -> int:
+    """Mask of every permission the features grant, a scope granting the lower ones"""
+    mask = 0
+    for f in features:
+        granted = (f.scope or Scope.org).level
+        for scope in Scope:
+            if scope.level <= granted:
+                mask |= permission_bit(f.action, f.resource, scope)
+    return mask
+
+
+def compile_required(features: Iterable["Feature"]) -> int:
+    """Mask of the permissions required by the features"""
+    mask = 0
+    for f in features:
+        mask |= permission_bit(f.action, f.resource, f.scope)
+    return mask
+
+
 class Feature(DynamoSerializableModel):
+    # Frozen so that the masks compiled from them can't go stale
+    model_config = ConfigDict(frozen=True)
+
     action: Action
     resource: Resource
     scope: Optional[Scope] = None
@@ -83,6 +125,12 @@ class PermissionedEntity(DynamoSerializableModel):
         description="Feature list each in format action:resource[:modifier]",
     )
 
+    # compile_granted(features), with the features it was compiled from as a
+    # tuple, so it is compiled again when the list changes in any way
+    _permission_mask: Optional[Tuple[Tuple[Feature, ...], int]] = PrivateAttr(
+        default=None
+    )
+
     @computed_field
     @cached_property
     def orgId(self) -> ULID:
@@ -143,9 +191,27 @@ class PermissionedEntity(DynamoSerializableModel):
         resource: Resource,
         required_scope: Scope,
     ) -> bool:
-        for f in getattr(self, "features", []):
-            if f.action == action and f.resource == resource:
-                user_scope = f.scope or Scope.org
-                if user_scope.includes(required_scope):
-                    return True
-        return False
+        bit = permission_bit(Action(action), Resource(resource), Scope(required_scope))
+        return bool(self.permission_mask() & bit)
+
+    def permission_mask(self) -> int:
+        # Features are frozen, so comparing the tuples (by identity first,
+        # then by value) catches every change made to the list in place
+        key = tuple(self.features)
+        # Read from __pydantic_private__ directly, the attribute lookup of
+        # private attributes costs more than the check itself
+        compiled = self.__pydantic_private__["_permission_mask"]
+        if compiled is None or compiled[0] != key:
+            compiled = (key, compile_granted(key))
+            self._permission_mask = compiled
+        return compiled[1]
+
+    def has_permissions(self, required: int, match: str = "any") -> bool:
+        """
+        Checks a mask from compile_required: any of its permissions, or all of
+        them when match is "all"
+        """
+        granted = self.permission_mask()
+        if match == "all":
+            return granted & required == required
+        return bool(granted & required)
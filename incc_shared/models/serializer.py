@@ -0,0 +1,234 @@
+"""
+Compiled to_item serializers. Each model class gets a function that builds
+its DynamoDB item straight from the instance: Decimals are kept as Decimal
+(stored as numbers), dates, datetimes and ULIDs become strings and enums
+their values. The rest matches model_dump(mode="json"), field serializers
+and computed fields included.
+"""
+
+import inspect
+import types
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+    get_args,
+    get_origin,
+)
+from uuid import UUID
+
+from pydantic import BaseModel
+from pydantic_core import to_jsonable_python
+from ulid import ULID
+
+Serializer = Callable[[BaseModel, bool], Dict[str, Any]]
+
+ULID_CACHE_SIZE = 4096
+
+serializers: Dict[type, Serializer] = {}
+
+
+def _datetime(value: datetime, exclude_none: bool) -> str:
+    # Pydantic writes UTC as Z
+    iso = value.isoformat()
+    return iso[:-6] + "Z" if iso.endswith("+00:00") else iso
+
+
+def _sequence(value: Any, exclude_none: bool) -> List[Any]:
+    return [dump_value(v, exclude_none) for v in value]
+
+
+def _mapping(value: dict, exclude_none: bool) -> Dict[Any, Any]:
+    return {k: dump_value(v, exclude_none) for k, v in value.items()}
+
+
+def _model(value: BaseModel, exclude_none: bool) -> Dict[str, Any]:
+    return get_serializer(type(value))(value, exclude_none)
+
+
+def _as_is(value: Any, exclude_none: bool) -> Any:
+    return value
+
+
+def _to_str(value: Any, exclude_none: bool) -> str:
+    return str(value)
+
+
+@lru_cache(maxsize=ULID_CACHE_SIZE)
+def _encode_ulid(raw: bytes) -> str:
+    return str(ULID(raw))
+
+
+def _ulid(value: ULID, exclude_none: bool) -> str:
+    # Encoding a ULID costs more than the rest of an item, and the same ids
+    # (orgs, payers) are written over and over
+    return _encode_ulid(value.bytes)
+
+
+_BASE_DUMPERS: Dict[type, Callable[[Any, bool], Any]] = {
+    str: _as_is,
+    int: _as_is,
+    bool: _as_is,
+    float: _as_is,
+    type(None): _as_is,
+    Decimal: _as_is,
+    datetime: _datetime,
+    date: lambda v, _: v.isoformat(),
+    ULID: _ulid,
+    UUID: _to_str,
+    list: _sequence,
+    tuple: _sequence,
+    set: _sequence,
+    frozenset: _sequence,
+    dict: _mapping,
+}
+# Dumpers by exact type, including the subclasses seen so far
+_dumpers = dict(_BASE_DUMPERS)
+
+
+def _dumper(kind: type) -> Callable[[Any, bool], Any]:
+    # Enums first, the str enums are also str
+    if issubclass(kind, Enum):
+        return lambda v, exclude_none: dump_value(v.value, exclude_none)
+    if issubclass(kind, BaseModel):
+        return _model
+    for base, dump in _BASE_DUMPERS.items():
+        if issubclass(kind, base):
+            return dump
+    return lambda v, _: to_jsonable_python(v)
+
+
+def dump_value(value: Any, exclude_none: bool = True) -> Any:
+    kind = type(value)
+    dump = _dumpers.get(kind)
+    if dump is None:
+        dump = _dumpers[kind] = _dumper(kind)
+    return dump(value, exclude_none)
+
+
+def _enum_value(value: Enum, exclude_none: bool) -> Any:
+    return value.value
+
+
+def _field_dumper(annotation: Any) -> Optional[Callable[[Any, bool], Any]]:
+    """
+    Dumper of the values of a field, from its annotation. None when the
+    values are stored as they are.
+    """
+    origin = get_origin(annotation)
+    if origin in (Union, types.UnionType):
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        # None values never reach the dumpers
+        return _field_dumper(args[0]) if len(args) == 1 else dump_value
+    if origin in (list, List):
+        args = get_args(annotation)
+        item = _field_dumper(args[0]) if args else dump_value
+        if item is None:
+            return lambda v, _: list(v)
+        return lambda v, exclude_none: [item(x, exclude_none) for x in v]
+
+    if not isinstance(annotation, type):
+        return dump_value
+    # Str enums hold the value of the member, which is exactly what is stored
+    if issubclass(annotation, Enum):
+        if issubclass(annotation, (str, int)) and not issubclass(annotation, bool):
+            return _enum_value
+        return dump_value
+    if annotation in (str, int, bool, Decimal):
+        return None
+    if annotation is ULID:
+        return _ulid
+    if annotation in (date, datetime):
+        return _BASE_DUMPERS[annotation]
+    if issubclass(annotation, BaseModel):
+        return _model
+    return dump_value
+
+
+def _plain_serializers(
+    model: Type[BaseModel],
+) -> Optional[Dict[str, Tuple[Callable, bool]]]:
+    """
+    Field serializers by field, with whether they also run for None. None when
+    the model serializes in a way the compiled serializer doesn't reproduce.
+    """
+    decorators = model.__pydantic_decorators__
+    if decorators.model_serializers:
+        return None
+
+    result = {}
+    for decorator in decorators.field_serializers.values():
+        func = decorator.func
+        if (
+            decorator.info.mode != "plain"
+            or not inspect.isfunction(func)
+            or len(inspect.signature(func).parameters) != 2
+        ):
+            return None
+        with_none = decorator.info.when_used in ("always", "json")
+        for name in decorator.info.fields:
+            result[name] = (func, with_none)
+    return result
+
+
+def _fallback(instance: BaseModel, exclude_none: bool) -> Dict[str, Any]:
+    dumped = instance.model_dump(exclude_none=exclude_none)
+    return {k: dump_value(v, exclude_none) for k, v in dumped.items()}
+
+
+def _compile(model: Type[BaseModel]) -> Serializer:
+    field_serializers = _plain_serializers(model)
+    if field_serializers is None:
+        return _fallback
+
+    fields = []
+    for name, field in model.model_fields.items():
+        if field.exclude:
+            continue
+        field_serializer = field_serializers.get(name)
+        # The output of field serializers can be anything
+        if field_serializer is None:
+            dump = _field_dumper(field.annotation)
+        else:
+            dump = dump_value
+        fields.append((name, field_serializer, dump))
+    computed = list(model.model_computed_fields)
+
+    def serialize(instance: BaseModel, exclude_none: bool) -> Dict[str, Any]:
+        values = instance.__dict__
+        item = {}
+        for name, field_serializer, dump in fields:
+            value = values.get(name)
+            if value is None:
+                if exclude_none:
+                    continue
+                if field_serializer is None or not field_serializer[1]:
+                    item[name] = None
+                    continue
+            if field_serializer is not None:
+                value = field_serializer[0](instance, value)
+            item[name] = value if dump is None else dump(value, exclude_none)
+
+        for name in computed:
+            value = getattr(instance, name)
+            if value is not None or not exclude_none:
+                item[name] = dump_value(value, exclude_none)
+        return item
+
+    return serialize
+
+
+def get_serializer(model: Type[BaseModel]) -> Serializer:
+    serializer = serializers.get(model)
+    if serializer is None:
+        serializer = serializers[model] = _compile(model)
+    return serializer
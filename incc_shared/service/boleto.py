@@ -1,16 +1,21 @@
+from typing import List, Optional
+
 from incc_shared.constants import EntityType
 from incc_shared.exceptions.errors import InvalidState
 from incc_shared.models.common import get_default_juros, get_default_multa
 from incc_shared.models.db.boleto.base import StatusBoleto
 from incc_shared.models.db.boleto.boleto import BoletoModel
+from incc_shared.models.db.organization.base import Defaults
 from incc_shared.models.request.boleto.create import CreateBoletoModel
 from incc_shared.models.request.boleto.update import UpdateBoletoModel
-from incc_shared.service.organization import get_org, update_nosso_numero
+from incc_shared.service.organization import get_org, reserve_nosso_numeros
 from incc_shared.service.storage.dynamodb import (
     create_dynamo_item,
     delete_dynamo_item,
     get_dynamo_item,
+    get_dynamo_items,
     get_dynamo_key,
+    iter_dynamo_entity,
     list_dynamo_entity,
     update_dynamo_item,
 )
@@ -21,43 +26,60 @@ def get_boleto(nosso_numero: int):
     return get_dynamo_item(key, BoletoModel)
 
 
-def create_boleto(boleto: CreateBoletoModel):
-    org = get_org()
-    if not org:
-        raise InvalidState("Org does not exist")
+def get_boletos(nossos_numeros: List[int]):
+    keys = [get_dynamo_key(EntityType.boleto, str(n)) for n in nossos_numeros]
+    return get_dynamo_items(keys, BoletoModel)
+
+
+def create_boleto(boleto: CreateBoletoModel, nosso_numero: Optional[int] = None):
+    """
+    nosso_numero should come from reserve_nosso_numeros. When not given, a
+    single number is reserved for this boleto.
+    """
+    if nosso_numero is None:
+        nosso_numero = reserve_nosso_numeros()[0]
+
+    defaults = None
+    if not boleto.juros or not boleto.multa:
+        org = get_org()
+        if not org:
+            raise InvalidState("Org does not exist")
+        defaults = org.defaults
+
+    model = build_boleto_model(boleto, nosso_numero, defaults)
+
+    # TODO: Criar boleto da caixa aqui e, se der errado, solta uma exceção
+
+    create_dynamo_item(model.to_item())
+
+    return nosso_numero
 
-    nosso_numero = org.nossoNumero
 
+def build_boleto_model(
+    boleto: CreateBoletoModel, nosso_numero: int, defaults: Optional[Defaults]
+):
     if not boleto.juros:
-        if org.defaults:
-            boleto.juros = org.defaults.juros
+        if defaults:
+            boleto.juros = defaults.juros
         else:
             boleto.juros = get_default_juros()
 
     if not boleto.multa:
-        if org.defaults:
-            boleto.multa = org.defaults.multa
+        if defaults:
+            boleto.multa = defaults.multa
         else:
             boleto.multa = get_default_multa()
 
-    model = BoletoModel(
+    return BoletoModel(
         nossoNumero=nosso_numero,
         status=[StatusBoleto.emitido],
         **boleto.to_item(),
     )
 
-    # TODO: Criar boleto da caixa aqui e, se der errado, solta uma exceção
-
-    create_dynamo_item(model.to_item())
-
-    update_nosso_numero(org)
-
-    return nosso_numero
-
 
 def update_boleto(nosso_numero: int, boleto: UpdateBoletoModel):
     key = get_dynamo_key(EntityType.boleto, str(nosso_numero))
-    update_dynamo_item(key, boleto.to_item())
+    update_dynamo_item(key, boleto.to_item(), return_values="NONE")
 
 
 def delete_boleto(nosso_numero: int):
@@ -65,5 +87,13 @@ def delete_boleto(nosso_numero: int):
     delete_dynamo_item(key)
 
 
-def list_boletos():
-    return list_dynamo_entity(EntityType.boleto, BoletoModel)
+def list_boletos(limit: Optional[int] = None, cursor: Optional[str] = None):
+    return list_dynamo_entity(
+        EntityType.boleto, BoletoModel, limit=limit, cursor=cursor, trusted=True
+    )
+
+
+def iter_boletos(page_size: Optional[int] = None):
+    return iter_dynamo_entity(
+        EntityType.boleto, BoletoModel, page_size=page_size, trusted=True
+    )
@@ -1,99 +1,429 @@
+import itertools
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import date
-from decimal import Decimal
-from typing import Optional
+from decimal import ROUND_FLOOR, Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import boto3
-from dateutil.relativedelta import relativedelta
+from botocore.exceptions import BotoCoreError, ClientError
 
 from incc_shared.exceptions.errors import InvalidState
+from incc_shared.service.incc_snapshot import Snapshot, load_snapshot
+from incc_shared.service.utils import add_months, month_date, month_key, month_ordinal
 
 BUCKET = os.environ["STORAGE_BUCKET"]
 KEY = "incc-index/history.json"
+INCC_CACHE_TTL = int(os.environ.get("INCC_CACHE_TTL", "3600"))  # seconds
 MAX_PARCELAS = 420
+REAJUSTE_CACHE_SIZE = 256
+# Relative distance from a half cent under which the cumulative factors are
+# not trusted to round like the month by month calculation. Both drift from
+# the exact value by far less than this.
+TOLERANCIA_ARREDONDAMENTO = Decimal("1e-18")
+MEIO_CENTAVO = Decimal("0.5")
+CENTAVO = Decimal("0.01")
+# Installments are calculated in integer cents for values below LIMITE_CENTAVOS
+# with at most CASAS_CENTAVOS decimals. Beyond that the Decimal products could
+# round at the context precision, so the Decimal calculation is used instead.
+LIMITE_CENTAVOS = Decimal("1e12")
+CASAS_CENTAVOS = 8
 
 
-incc_cache = None
+class INCCHistoryCache:
+    """
+    Process wide copy of the INCC history stored in S3. Once ttl seconds have
+    passed, the next read revalidates it with If-None-Match, so an unchanged
+    history costs a 304 and no parsing. When S3 fails, the stale copy is kept
+    and revalidated again after another ttl.
+    """
+
+    def __init__(self, bucket: str, key: str, ttl: float):
+        self.bucket = bucket
+        self.key = key
+        self.ttl = ttl
+        self.history: Optional[List[Dict[str, Any]]] = None
+        self.etag: Optional[str] = None
+        # Incremented whenever a different history is loaded
+        self.version = 0
+        self.expires_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.not_modified = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._s3 = None
+
+    def get(self) -> List[Dict[str, Any]]:
+        if self.history is not None and time.monotonic() < self.expires_at:
+            self.hits += 1
+            return self.history
+
+        with self._lock:
+            if self.history is None or time.monotonic() >= self.expires_at:
+                self.misses += 1
+                self.refresh()
+            else:
+                self.hits += 1
+        assert self.history is not None
+        return self.history
+
+    def refresh(self):
+        if self._s3 is None:
+            self._s3 = boto3.client("s3")
+
+        request = {"Bucket": self.bucket, "Key": self.key}
+        if self.history is not None and self.etag:
+            request["IfNoneMatch"] = self.etag
+
+        try:
+            response = self._s3.get_object(**request)
+        except ClientError as e:
+            status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            if status == 304:
+                self.not_modified += 1
+                self.expires_at = time.monotonic() + self.ttl
+                return
+            self._keep_stale(e)
+            return
+        except BotoCoreError as e:
+            self._keep_stale(e)
+            return
+
+        content = response["Body"].read().decode("utf-8")
+        self.history = json.loads(content)
+        self.etag = response.get("ETag")
+        self.version += 1
+        self.refreshes += 1
+        self.expires_at = time.monotonic() + self.ttl
+
+    def _keep_stale(self, error: Exception):
+        if self.history is None:
+            raise error
+
+        print(f"Failed to refresh INCC history, using stale copy: {error}")
+        self.errors += 1
+        self.expires_at = time.monotonic() + self.ttl
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+        }
+
+
+incc_history = INCCHistoryCache(BUCKET, KEY, INCC_CACHE_TTL)
+incc_snapshot: Optional[Snapshot] = load_snapshot()
+indice_cache: Optional["IndiceINCC"] = None
+versoes_indice = itertools.count(1)
+reajuste_cache: "OrderedDict[Tuple[str, date, int], Dict[str, Any]]" = OrderedDict()
+reajuste_lock = threading.Lock()
+reajuste_stats = {"hits": 0, "misses": 0}
 
 
 def formata_data_indice(raw_date: date):
     return raw_date.strftime("%d/%m/%Y")
 
 
+def mes_esperado():
+    """Newest month the history is expected to have"""
+    return month_ordinal(date.today()) - 1
+
+
 def get_incc_list():
-    global incc_cache
+    """
+    The bundled snapshot while it has the newest expected month, the S3
+    history otherwise. The snapshot is also used if S3 can't be read.
+    """
+    snapshot = incc_snapshot
+    if snapshot and snapshot.fim >= mes_esperado():
+        return snapshot.history
+
+    try:
+        return incc_history.get()
+    except (ClientError, BotoCoreError) as e:
+        if not snapshot:
+            raise
+        print(f"Failed to read INCC history, using bundled snapshot: {e}")
+        return snapshot.history
+
+
+class IndiceINCC:
+    """
+    INCC history indexed by month ordinal, with cumulative factors so that the
+    adjustment between two months is a single division.
+    """
+
+    def __init__(self, lista: List[Dict[str, Any]]):
+        self.lista = lista
+        # Identifies the history the memoized results were calculated from
+        self.versao = next(versoes_indice)
+        self.mapa = {i["data"]: i["valor"] for i in lista}
+
+        por_mes = {}
+        for data_indice, valor in self.mapa.items():
+            dia, mes, ano = (int(p) for p in data_indice.split("/"))
+            if dia == 1:
+                por_mes[ano * 12 + mes - 1] = valor
+
+        self.inicio = min(por_mes, default=0)
+        total = max(por_mes, default=-1) - self.inicio + 1
+        self.incc: List[Optional[Any]] = [
+            por_mes.get(self.inicio + i) for i in range(total)
+        ]
+
+        # fatores[i] is the product of the factors of the months before i
+        self.fatores = [Decimal(1)]
+        for incc in self.incc:
+            fator = 1 + Decimal(incc) / 100 if incc is not None else 1
+            self.fatores.append(self.fatores[-1] * fator)
+
+        self.taxas = [Decimal(i) if i is not None else None for i in self.incc]
+
+        # The factor of each month as an integer over escala, for the integer
+        # cents calculation. escala fits the INCC with the most decimals.
+        casas = max(
+            (-i.as_tuple().exponent for i in self.taxas if i is not None),
+            default=0,
+        )
+        self.escala = 100 * 10 ** max(casas, 0)
+        self.fatores_inteiros = [
+            self.escala + int(i * self.escala / 100) if i is not None else None
+            for i in self.taxas
+        ]
+
+        # Adjustment between two month offsets, filled as they are requested
+        self.razoes: Dict[Tuple[int, int], Decimal] = {}
+
+        # fim_sequencia[i] is the first month after i missing from the history
+        self.fim_sequencia = [0] * total
+        fim = total
+        for i in range(total - 1, -1, -1):
+            if self.incc[i] is None:
+                fim = i
+            self.fim_sequencia[i] = fim
+
+    def intervalo(self, data_inicio: date, data_fim: Optional[date] = None):
+        """
+        Offsets of the months applied when adjusting from data_inicio up to,
+        but not including, data_fim or the first month missing in the history
+        """
+        inicio = month_ordinal(data_inicio) - self.inicio
+        if inicio < 0 or inicio >= len(self.incc):
+            return inicio, inicio
+
+        fim = self.fim_sequencia[inicio]
+        if data_fim:
+            fim = min(fim, month_ordinal(data_fim) - self.inicio)
+        return inicio, max(fim, inicio)
+
+    def razao(self, inicio: int, fim: int) -> Decimal:
+        chave = (inicio, fim)
+        razao = self.razoes.get(chave)
+        if razao is None:
+            razao = self.fatores[fim] / self.fatores[inicio]
+            self.razoes[chave] = razao
+        return razao
+
+    def reajusta(self, valor: Decimal, inicio: int, fim: int):
+        """
+        Same result as applying the months one by one. Values too close to a
+        half cent to be rounded safely from the cumulative factors are
+        recalculated month by month.
+        """
+        if fim <= inicio:
+            return round(valor, 2)
+
+        resultado = valor * self.razao(inicio, fim)
+        centavos = resultado.scaleb(2)
+        resto = centavos - centavos.to_integral_value(rounding=ROUND_FLOOR)
+        margem = (centavos.copy_abs() + 1) * TOLERANCIA_ARREDONDAMENTO
+        if abs(resto - MEIO_CENTAVO) <= margem:
+            return self.reajusta_iterativo(valor, inicio, fim)
+        return round(resultado, 2)
+
+    def reajusta_iterativo(self, valor: Decimal, inicio: int, fim: int):
+        resultado = valor
+        for incc in self.incc[inicio:fim]:
+            resultado = resultado * (1 + Decimal(incc) / 100)
+        return round(resultado, 2)
+
 
-    if incc_cache is not None:
-        return incc_cache
+def get_indice_incc() -> IndiceINCC:
+    global indice_cache
 
-    s3 = boto3.client("s3")
-    response = s3.get_object(Bucket=BUCKET, Key=KEY)
-    content = response["Body"].read().decode("utf-8")
-    incc_cache = json.loads(content)
-    return incc_cache
+    lista = get_incc_list()
+    if indice_cache is None or indice_cache.lista is not lista:
+        indice_cache = IndiceINCC(lista)
+    return indice_cache
 
 
 def get_incc_map():
-    return {i["data"]: i["valor"] for i in get_incc_list()}
-
-
-def calcula_reajuste(valor: Decimal, data_inicio: date):
-    lista_incc = get_incc_map()
-    data_atual = data_inicio.replace(day=1)
-    resultado = {
-        "data_inicio": data_inicio,
-        "valor_original": valor,
-        "reajustes": [
-            {
-                "data_parcela": data_inicio,
-                "data_incc": None,
-                "incc": None,
-                "valor": valor,
-            }
-        ],
-    }
+    return get_indice_incc().mapa
+
+
+def _arredonda(numerador: int, denominador: int) -> int:
+    """numerador / denominador rounded half to even, like round(Decimal)"""
+    quociente, resto = divmod(numerador, denominador)
+    if 2 * resto > denominador or (2 * resto == denominador and quociente % 2):
+        quociente += 1
+    return quociente
+
+
+def _parcelas_centavos(
+    indice: IndiceINCC, valor: Decimal, inicio: int, fim: int
+) -> Iterator[Decimal]:
+    """
+    The installment values from valor in integer cents. Each step is exact
+    and rounded half to even, so the results match _parcelas_decimal.
+    """
+    if fim <= inicio:
+        return
+
+    fatores = indice.fatores_inteiros
+    escala = indice.escala
+    metade = escala // 2
+    numerador, denominador = valor.as_integer_ratio()
+    centavos = _arredonda(numerador * 100 * fatores[inicio], denominador * escala)
+    yield Decimal(centavos) * CENTAVO
+
+    for fator in fatores[inicio + 1 : fim]:
+        centavos, resto = divmod(centavos * fator, escala)
+        if resto > metade or (resto == metade and centavos & 1):
+            centavos += 1
+        yield Decimal(centavos) * CENTAVO
+
+
+def _parcelas_decimal(
+    indice: IndiceINCC, valor: Decimal, inicio: int, fim: int
+) -> Iterator[Decimal]:
     ultima_parcela = valor
-    for i in range(MAX_PARCELAS):
-        data_indice = formata_data_indice(data_atual)
-        try:
-            incc = Decimal(lista_incc[data_indice])
-            parcela = round(ultima_parcela * (1 + incc / 100), 2)
-            resultado["reajustes"].append(
-                {
-                    "data_parcela": data_inicio + relativedelta(months=i + 1),
-                    "data_incc": data_atual,
-                    "incc": incc,
-                    "valor": parcela,
-                }
-            )
-            ultima_parcela = parcela
-            data_atual += relativedelta(months=1)
-        except KeyError:
-            break
+    for incc in indice.taxas[inicio:fim]:
+        ultima_parcela = round(ultima_parcela * (1 + incc / 100), 2)
+        yield ultima_parcela
+
+
+def iter_reajuste(
+    valor: Union[Decimal, int], data_inicio: date
+) -> Iterator[Dict[str, Any]]:
+    """
+    Installments of calcula_reajuste, calculated as they are consumed, so
+    reading the first few doesn't go through the whole history
+    """
+    # Whole amounts may come as int, as from JSON parsed with parse_float=Decimal
+    valor = valor if isinstance(valor, Decimal) else Decimal(valor)
+    indice = get_indice_incc()
+    yield {
+        "data_parcela": data_inicio,
+        "data_incc": None,
+        "incc": None,
+        "valor": valor,
+    }
+
+    inicio = month_ordinal(data_inicio) - indice.inicio
+    fim = min(inicio + MAX_PARCELAS, len(indice.incc))
+    if 0 <= inicio < len(indice.incc):
+        fim = min(fim, indice.fim_sequencia[inicio])
+    else:
+        fim = inicio
+
+    if (
+        valor.is_finite()
+        and abs(valor) < LIMITE_CENTAVOS
+        and valor.as_tuple().exponent >= -CASAS_CENTAVOS
+    ):
+        parcelas = _parcelas_centavos(indice, valor, inicio, fim)
     else:
+        parcelas = _parcelas_decimal(indice, valor, inicio, fim)
+
+    for i, parcela in enumerate(parcelas):
+        offset = inicio + i
+        yield {
+            "data_parcela": add_months(data_inicio, i + 1),
+            "data_incc": month_date(indice.inicio + offset),
+            "incc": indice.taxas[offset],
+            "valor": parcela,
+        }
+
+    if fim - inicio == MAX_PARCELAS:
         raise InvalidState("Limite de calculo atingido")
-    return resultado
 
 
-def calcula_valor(valor: Decimal, data_inicio: date, data_fim: Optional[date] = None):
-    data_atual = data_inicio.replace(day=1)
-    data_fim = data_fim.replace(day=1) if data_fim else None
-    lista_incc = get_incc_map()
-    resultado = valor
-    for _ in range(MAX_PARCELAS):
-        if data_fim and data_atual >= data_fim:
-            break
-
-        data_indice = formata_data_indice(data_atual)
-        try:
-            incc = Decimal(lista_incc[data_indice])
-            resultado = resultado * (1 + incc / 100)
-        except KeyError as e:
-            print(f"Data {e} não existe")
-            break
-        data_atual += relativedelta(months=1)
-    else:
+def calcula_reajuste(valor: Union[Decimal, int], data_inicio: date):
+    """
+    All installments of iter_reajuste. The last REAJUSTE_CACHE_SIZE results
+    are kept for the current history, and copies of them are returned.
+    """
+    valor = valor if isinstance(valor, Decimal) else Decimal(valor)
+    chave = (str(valor), data_inicio, get_indice_incc().versao)
+    with reajuste_lock:
+        resultado = reajuste_cache.get(chave)
+        if resultado is not None:
+            reajuste_cache.move_to_end(chave)
+            reajuste_stats["hits"] += 1
+
+    if resultado is None:
+        resultado = {
+            "data_inicio": data_inicio,
+            "valor_original": valor,
+            "reajustes": list(iter_reajuste(valor, data_inicio)),
+        }
+        with reajuste_lock:
+            reajuste_stats["misses"] += 1
+            reajuste_cache[chave] = resultado
+            if len(reajuste_cache) > REAJUSTE_CACHE_SIZE:
+                reajuste_cache.popitem(last=False)
+
+    return {
+        **resultado,
+        "reajustes": [dict(reajuste) for reajuste in resultado["reajustes"]],
+    }
+
+
+def _intervalo_calculo(
+    indice: IndiceINCC, data_inicio: date, data_fim: Optional[date]
+) -> Tuple[int, int]:
+    inicio, fim = indice.intervalo(data_inicio, data_fim)
+    if fim - inicio >= MAX_PARCELAS:
         raise InvalidState("Limite de calculo atingido")
 
-    return round(resultado, 2)
+    mes_parada = month_ordinal(data_inicio) + fim - inicio
+    if not data_fim or mes_parada < month_ordinal(data_fim):
+        print(f"Data '{month_key(mes_parada)}' não existe")
+
+    return inicio, fim
+
+
+def calcula_valor(valor: Decimal, data_inicio: date, data_fim: Optional[date] = None):
+    indice = get_indice_incc()
+    inicio, fim = _intervalo_calculo(indice, data_inicio, data_fim)
+    return indice.reajusta(valor, inicio, fim)
+
+
+def calcula_valores(
+    pares: Iterable[Tuple[Decimal, date]], data_fim: Optional[date] = None
+) -> List[Decimal]:
+    """
+    calcula_valor for many (valor, data_inicio) pairs sharing the same
+    data_fim. The interval of each distinct start month is resolved once, and
+    the adjustment factors are shared, so each pair costs one multiplication.
+    """
+    indice = get_indice_incc()
+    intervalos: Dict[int, Tuple[int, int]] = {}
+    resultados = []
+    for valor, data_inicio in pares:
+        mes = month_ordinal(data_inicio)
+        intervalo = intervalos.get(mes)
+        if intervalo is None:
+            intervalo = _intervalo_calculo(indice, data_inicio, data_fim)
+            intervalos[mes] = intervalo
+        resultados.append(indice.reajusta(valor, *intervalo))
+    return resultados
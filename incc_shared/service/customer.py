@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from ulid import ULID
 
 from incc_shared.constants import EntityType
@@ -5,10 +7,14 @@ from incc_shared.models.db.customer import CustomerModel
 from incc_shared.models.request.customer.create import CreateCustomerModel
 from incc_shared.models.request.customer.update import UpdateCustomerModel
 from incc_shared.service.storage.dynamodb import (
+    bulk_create_items,
+    bulk_delete_items,
     create_dynamo_item,
     delete_dynamo_item,
     get_dynamo_item,
+    get_dynamo_items,
     get_dynamo_key,
+    iter_dynamo_entity,
     list_dynamo_entity,
     update_dynamo_item,
 )
@@ -19,8 +25,21 @@ def get_customer(customerId: ULID):
     return get_dynamo_item(key, CustomerModel)
 
 
-def list_customers():
-    return list_dynamo_entity(EntityType.customer, CustomerModel)
+def get_customers(customerIds: List[ULID]):
+    keys = [get_dynamo_key(EntityType.customer, c) for c in customerIds]
+    return get_dynamo_items(keys, CustomerModel)
+
+
+def list_customers(limit: Optional[int] = None, cursor: Optional[str] = None):
+    return list_dynamo_entity(
+        EntityType.customer, CustomerModel, limit=limit, cursor=cursor, trusted=True
+    )
+
+
+def iter_customers(page_size: Optional[int] = None):
+    return iter_dynamo_entity(
+        EntityType.customer, CustomerModel, page_size=page_size, trusted=True
+    )
 
 
 def create_customer(customer: CreateCustomerModel):
@@ -32,6 +51,17 @@ def create_customer(customer: CreateCustomerModel):
     return customerId
 
 
+def create_customers(customers: List[CreateCustomerModel]):
+    customerIds = [ULID() for _ in customers]
+    items = [
+        CustomerModel(customerId=customerId, **customer.to_item()).to_item()
+        for customerId, customer in zip(customerIds, customers)
+    ]
+
+    results = bulk_create_items(items)
+    return list(zip(customerIds, results))
+
+
 def update_customer(customerId: ULID, to_update: UpdateCustomerModel):
     key = get_dynamo_key(EntityType.customer, customerId)
     return update_dynamo_item(key, to_update.to_item())
@@ -41,3 +71,8 @@ def delete_customer(customerId: ULID):
     key = get_dynamo_key(EntityType.customer, customerId)
     delete_dynamo_item(key)
     return customerId
+
+
+def delete_customers(customerIds: List[ULID]):
+    keys = [get_dynamo_key(EntityType.customer, c) for c in customerIds]
+    return bulk_delete_items(keys)
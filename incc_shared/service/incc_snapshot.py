@@ -0,0 +1,128 @@
+"""
+Compact INCC history bundled with the package, so the calculator can run
+without reading history.json from S3 on cold starts.
+
+The snapshot is a small header followed by one signed 32 bit integer per
+month, the INCC scaled by 10 ** decimals. Months missing from the history are
+stored as MISSING. To regenerate it from history.json:
+
+    python -m incc_shared.service.incc_snapshot history.json
+"""
+
+import argparse
+import json
+import struct
+import sys
+from array import array
+from decimal import Decimal
+from importlib import resources
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from incc_shared.service.utils import month_key
+
+MAGIC = b"INCC"
+# magic, decimals, first month ordinal, number of months
+HEADER = struct.Struct("<4sBiI")
+MISSING = -(2**31)
+PACKAGE = "incc_shared"
+RESOURCE = "data/incc_history.bin"
+
+
+class Snapshot(NamedTuple):
+    inicio: int
+    fim: int
+    history: List[Dict[str, Any]]
+
+
+def _ordinal(data_indice: str):
+    dia, mes, ano = (int(p) for p in data_indice.split("/"))
+    if dia != 1:
+        raise ValueError(f"Invalid INCC date: {data_indice}")
+    return ano * 12 + mes - 1
+
+
+def _to_array(values: List[int]):
+    scaled = array("i", values)
+    if sys.byteorder == "big":
+        scaled.byteswap()
+    return scaled
+
+
+def build_snapshot(history: List[Dict[str, Any]]) -> bytes:
+    por_mes = {_ordinal(i["data"]): Decimal(i["valor"]) for i in history}
+    if not por_mes:
+        raise ValueError("Empty INCC history")
+
+    decimals = max(max(-v.as_tuple().exponent, 0) for v in por_mes.values())
+    inicio = min(por_mes)
+    total = max(por_mes) - inicio + 1
+
+    values = []
+    for ordinal in range(inicio, inicio + total):
+        valor = por_mes.get(ordinal)
+        values.append(MISSING if valor is None else int(valor.scaleb(decimals)))
+
+    header = HEADER.pack(MAGIC, decimals, inicio, total)
+    return header + _to_array(values).tobytes()
+
+
+def read_snapshot(data: bytes) -> Snapshot:
+    magic, decimals, inicio, total = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Invalid INCC snapshot")
+
+    values = _to_array([])
+    values.frombytes(data[HEADER.size :])
+    if len(values) != total:
+        raise ValueError("Truncated INCC snapshot")
+
+    history = [
+        {
+            "data": month_key(inicio + i),
+            "valor": str(Decimal(valor).scaleb(-decimals)),
+        }
+        for i, valor in enumerate(values)
+        if valor != MISSING
+    ]
+    return Snapshot(inicio, inicio + total - 1, history)
+
+
+def load_snapshot() -> Optional[Snapshot]:
+    """The snapshot bundled with the package, or None when it is not shipped"""
+    try:
+        data = resources.files(PACKAGE).joinpath(RESOURCE).read_bytes()
+    except FileNotFoundError:
+        return None
+    return read_snapshot(data)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Regenerates the INCC snapshot from history.json"
+    )
+    parser.add_argument("history", help="Path to history.json")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=str(resources.files(PACKAGE).joinpath(RESOURCE)),
+        help="Snapshot path, defaults to the one bundled with the package",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.history) as f:
+        history = json.load(f)
+
+    data = build_snapshot(history)
+    with open(args.output, "wb") as f:
+        f.write(data)
+
+    snapshot = read_snapshot(data)
+    print(
+        f"Wrote {len(snapshot.history)} months "
+        f"({snapshot.history[0]['data']} to {snapshot.history[-1]['data']}) "
+        f"to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ from botocore.exceptions import ClientError
 
 from incc_shared.auth.context import get_context_entity
 from incc_shared.constants import EntityType
-from incc_shared.exceptions.errors import InvalidState
+from incc_shared.exceptions.errors import InvalidData, InvalidState
 from incc_shared.models.common import get_default_juros, get_default_multa
 from incc_shared.models.db.organization import OrganizationModel
 from incc_shared.models.db.organization.base import Defaults
@@ -11,6 +11,7 @@ from incc_shared.models.request.organization.update import UpdateOrganizationMod
 from incc_shared.service.storage.dynamodb import (
     get_dynamo_item,
     get_dynamo_key,
+    increment_dynamo_counter,
     set_dynamo_item,
     update_dynamo_item,
 )
@@ -58,7 +59,15 @@ def update_organization(patch: UpdateOrganizationModel):
         raise
 
 
-def update_nosso_numero(org: OrganizationModel):
-    nossoNumero = org.nossoNumero + 1
-    patch_org = UpdateOrganizationModel(nossoNumero=nossoNumero)
-    update_organization(patch_org)
+def reserve_nosso_numeros(count: int = 1) -> range:
+    """
+    Atomically reserves count consecutive nossoNumeros in a single update, so
+    callers can hand them out locally. Numbers that end up unused are skipped.
+    """
+    if count < 1:
+        raise InvalidData("At least one nossoNumero must be reserved")
+
+    user = get_context_entity()
+    key = get_dynamo_key(EntityType.organization, user.orgId)
+    next_free = increment_dynamo_counter(key, "nossoNumero", count)
+    return range(next_free - count, next_free)
@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from ulid import ULID
 
 from incc_shared.constants import EntityType
@@ -8,7 +10,9 @@ from incc_shared.service.storage.dynamodb import (
     create_dynamo_item,
     delete_dynamo_item,
     get_dynamo_item,
+    get_dynamo_items,
     get_dynamo_key,
+    iter_dynamo_entity,
     list_dynamo_entity,
     update_dynamo_item,
 )
@@ -19,8 +23,21 @@ def get_schedule(schedule_id: ULID):
     return get_dynamo_item(key, ScheduleModel)
 
 
-def list_schedules():
-    return list_dynamo_entity(EntityType.schedule, ScheduleModel)
+def get_schedules(schedule_ids: List[ULID]):
+    keys = [get_dynamo_key(EntityType.schedule, s) for s in schedule_ids]
+    return get_dynamo_items(keys, ScheduleModel)
+
+
+def list_schedules(limit: Optional[int] = None, cursor: Optional[str] = None):
+    return list_dynamo_entity(
+        EntityType.schedule, ScheduleModel, limit=limit, cursor=cursor, trusted=True
+    )
+
+
+def iter_schedules(page_size: Optional[int] = None):
+    return iter_dynamo_entity(
+        EntityType.schedule, ScheduleModel, page_size=page_size, trusted=True
+    )
 
 
 def create_schedule(schedule: CreateScheduleModel):
@@ -12,6 +12,9 @@ DYNAMODB_TABLE = os.environ["DYNAMODB_TABLE"]
 
 dynamodb = boto3.resource("dynamodb")
 table = dynamodb.Table(DYNAMODB_TABLE)
+# The resource's client converts every item with TypeSerializer and
+# TypeDeserializer, so queries that use storage.codec need their own client
+client = boto3.client("dynamodb")
 
 
 def _normalize_value(v: Any) -> Any:
@@ -0,0 +1,206 @@
+"""
+Converts items between DynamoDB's AttributeValue format, as the low level
+client sends and receives them, and the values the models are built from.
+
+The table resource deserializes every attribute with TypeDeserializer and
+normalize_item walks the result again. Here each attribute is decoded once,
+straight to what normalize_item would have produced, with decoders chosen
+per model field from its annotation.
+"""
+
+import base64
+import types
+from datetime import date
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Dict, List, Type, Union, get_args, get_origin
+
+from boto3.dynamodb.types import DYNAMODB_CONTEXT
+from pydantic import BaseModel
+
+Decoder = Callable[[dict], Any]
+
+codecs: Dict[type, "ItemCodec"] = {}
+
+
+def _number(n: str) -> Any:
+    # Same as normalize_item, integer valued numbers become int
+    try:
+        return int(n)
+    except ValueError:
+        value = Decimal(n)
+        return int(value) if value % 1 == 0 else value
+
+
+def _binary(b: bytes) -> str:
+    try:
+        return b.decode("utf-8")
+    except UnicodeDecodeError:
+        return base64.b64encode(b).decode("ascii")
+
+
+def decode_value(attribute: dict) -> Any:
+    ((tag, value),) = attribute.items()
+    return _DECODERS[tag](value)
+
+
+def decode_item(item: dict) -> dict:
+    return {k: decode_value(v) for k, v in item.items()}
+
+
+_DECODERS: Dict[str, Callable[[Any], Any]] = {
+    "S": lambda v: v,
+    "N": _number,
+    "BOOL": lambda v: v,
+    "NULL": lambda v: None,
+    "B": _binary,
+    "L": lambda v: [decode_value(x) for x in v],
+    "M": decode_item,
+    "SS": list,
+    "NS": lambda v: [_number(x) for x in v],
+    "BS": lambda v: [_binary(x) for x in v],
+}
+
+
+def _serialize_number(value: Any) -> dict:
+    number = str(DYNAMODB_CONTEXT.create_decimal(value))
+    if number in ("Infinity", "NaN"):
+        raise TypeError("Infinity and NaN not supported")
+    return {"N": number}
+
+
+def _serialize_set(value: Union[set, frozenset]) -> dict:
+    if all(isinstance(v, str) for v in value):
+        return {"SS": list(value)}
+    if all(isinstance(v, (bytes, bytearray)) for v in value):
+        return {"BS": list(value)}
+    return {"NS": [_serialize_number(v)["N"] for v in value]}
+
+
+def encode_value(value: Any) -> dict:
+    """Same as TypeSerializer.serialize, for the values to_item produces"""
+    encode = _ENCODERS.get(type(value))
+    if encode is not None:
+        return encode(value)
+
+    # Subclasses, like the str enums
+    if isinstance(value, Enum):
+        return encode_value(value.value)
+    for kind, encode in _ENCODERS.items():
+        if isinstance(value, kind):
+            return encode(value)
+    raise TypeError(f"Unsupported type {type(value)} for value {value}")
+
+
+def encode_item(item: dict) -> dict:
+    return {k: encode_value(v) for k, v in item.items()}
+
+
+def _float(value: float) -> dict:
+    raise TypeError("Float types are not supported. Use Decimal types instead.")
+
+
+_ENCODERS: Dict[type, Callable[[Any], dict]] = {
+    str: lambda v: {"S": v},
+    bool: lambda v: {"BOOL": v},
+    int: _serialize_number,
+    Decimal: _serialize_number,
+    float: _float,
+    type(None): lambda v: {"NULL": True},
+    list: lambda v: {"L": [encode_value(x) for x in v]},
+    tuple: lambda v: {"L": [encode_value(x) for x in v]},
+    dict: lambda v: {"M": encode_item(v)},
+    set: _serialize_set,
+    frozenset: _serialize_set,
+    bytes: lambda v: {"B": v},
+    bytearray: lambda v: {"B": bytes(v)},
+}
+
+
+def _int_decoder(attribute: dict) -> Any:
+    n = attribute.get("N")
+    if n is not None and "." not in n and "E" not in n and "e" not in n:
+        return int(n)
+    return decode_value(attribute)
+
+
+def _str_decoder(attribute: dict) -> Any:
+    s = attribute.get("S")
+    return s if s is not None else decode_value(attribute)
+
+
+def _model_decoder(model: Type[BaseModel]) -> Decoder:
+    def decode(attribute: dict) -> Any:
+        fields = attribute.get("M")
+        if fields is None:
+            return decode_value(attribute)
+        return get_codec(model).decode(fields)
+
+    return decode
+
+
+def _list_decoder(item: Decoder) -> Decoder:
+    def decode(attribute: dict) -> Any:
+        values = attribute.get("L")
+        if values is None:
+            return decode_value(attribute)
+        return [item(x) for x in values]
+
+    return decode
+
+
+def _decoder(annotation: Any) -> Decoder:
+    origin = get_origin(annotation)
+    if origin in (Union, types.UnionType):
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        # NULL falls back to decode_value in every decoder
+        return _decoder(args[0]) if len(args) == 1 else decode_value
+    if origin in (list, List):
+        args = get_args(annotation)
+        return _list_decoder(_decoder(args[0]) if args else decode_value)
+
+    if not isinstance(annotation, type) or annotation is bool:
+        return decode_value
+    if issubclass(annotation, BaseModel):
+        return _model_decoder(annotation)
+    if issubclass(annotation, (str, date)):
+        return _str_decoder
+    if issubclass(annotation, int):
+        return _int_decoder
+    return decode_value
+
+
+class ItemCodec:
+    """
+    Decodes the items of a model from the AttributeValue format, and encodes
+    to_item() output back to it. Attributes that are not fields of the model,
+    like the GSI keys, are decoded as normalize_item would.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.decoders = {
+            name: _decoder(field.annotation)
+            for name, field in model.model_fields.items()
+        }
+
+    def decode(self, item: dict) -> dict:
+        decoders = self.decoders
+        values = {}
+        for name, attribute in item.items():
+            decode = decoders.get(name)
+            if decode is None:
+                values[name] = decode_value(attribute)
+            else:
+                values[name] = decode(attribute)
+        return values
+
+    def encode(self, item: dict) -> dict:
+        return encode_item(item)
+
+
+def get_codec(model: Type[BaseModel]) -> ItemCodec:
+    codec = codecs.get(model)
+    if codec is None:
+        codec = codecs[model] = ItemCodec(model)
+    return codec
@@ -0,0 +1,72 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Any
+
+from incc_shared.exceptions.errors import InvalidData
+
+# Seconds a cursor stays valid after it is issued
+CURSOR_TTL = int(os.environ.get("CURSOR_TTL", "3600"))
+
+
+def get_pagination_secret() -> bytes:
+    try:
+        return os.environ["PAGINATION_SECRET"].encode("utf-8")
+    except KeyError:
+        raise RuntimeError("PAGINATION_SECRET not set")
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(encoded: str) -> bytes:
+    padding = "=" * (-len(encoded) % 4)
+    return base64.urlsafe_b64decode(encoded + padding)
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(get_pagination_secret(), payload, hashlib.sha256).digest()
+
+
+def encode_cursor(last_key: dict[str, Any], tenant: str, scope: str) -> str:
+    """
+    Turns a LastEvaluatedKey into an opaque token. The token is signed and bound
+    to the tenant and to the scope of the listing (the entity type or index), so
+    it can't be edited or replayed against another org or listing. It expires
+    CURSOR_TTL seconds after being issued.
+    """
+    payload = json.dumps(
+        {"tenant": tenant, "scope": scope, "iat": int(time.time()), "key": last_key},
+        separators=(",", ":"),
+        sort_keys=True,
+    ).encode("utf-8")
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+
+def decode_cursor(cursor: str, tenant: str, scope: str) -> dict[str, Any]:
+    try:
+        encoded_payload, encoded_signature = cursor.split(".")
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+    except ValueError:
+        raise InvalidData("Invalid pagination cursor")
+
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidData("Invalid pagination cursor")
+
+    data = json.loads(payload)
+    if data.get("tenant") != tenant:
+        raise InvalidData("Pagination cursor does not belong to this org")
+
+    if data.get("scope") != scope:
+        raise InvalidData("Pagination cursor does not belong to this listing")
+
+    issued_at = data.get("iat")
+    if not isinstance(issued_at, int) or time.time() - issued_at > CURSOR_TTL:
+        raise InvalidData("Pagination cursor expired")
+
+    return data["key"]
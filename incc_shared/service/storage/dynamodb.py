@@ -1,17 +1,75 @@
+import copy
+import os
+import random
 import time
-from typing import Any, Optional, Type
-
-from boto3.dynamodb.conditions import Attr, ConditionBase, Key
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Type
+
+from boto3.dynamodb.conditions import (
+    Attr,
+    ConditionBase,
+    ConditionExpressionBuilder,
+    Key,
+)
+from boto3.dynamodb.types import TypeDeserializer
 from botocore.exceptions import ClientError
 from ulid import ULID
 
 from incc_shared.auth.context import get_context_entity
 from incc_shared.constants import EntityType
-from incc_shared.exceptions.errors import Conflict, IdempotencyError, InvalidState
+from incc_shared.exceptions.errors import (
+    Conflict,
+    IdempotencyError,
+    InvalidData,
+    InvalidState,
+    TransactionCanceled,
+)
 from incc_shared.models.helper import utc_now_iso
-from incc_shared.service.storage.base import M, table, to_model
+from incc_shared.service.cache import TTLCache
+from incc_shared.service.storage.base import (
+    DYNAMODB_TABLE,
+    M,
+    client,
+    dynamodb,
+    table,
+    to_model,
+)
+from incc_shared.service.storage.codec import decode_item, encode_item, get_codec
+from incc_shared.service.storage.cursor import decode_cursor, encode_cursor
+from incc_shared.service.storage.identity_map import MISSING, get_identity_map
+from incc_shared.service.storage.trusted import to_trusted_model
 
 LOCK_DURATION = 3600  # 1 hour
+BATCH_GET_LIMIT = 100
+BATCH_MAX_RETRIES = 5
+BATCH_WRITE_LIMIT = 25
+BATCH_WRITE_WORKERS = 4
+BATCH_BACKOFF_BASE = 0.05  # seconds
+UPDATE_EXPRESSION_CACHE_SIZE = 256
+UPDATE_RETURN_VALUES = ("NONE", "UPDATED_NEW", "ALL_NEW")
+NEW_ITEM_CONDITION = "attribute_not_exists(tenant) AND attribute_not_exists(entity)"
+ITEM_CACHE_SIZE = 1024
+ITEM_CACHE_TTL = int(os.environ.get("ITEM_CACHE_TTL", "60"))  # seconds
+# Read on nearly every invocation and rarely changed, so they are kept across
+# warm invocations. Writes from this process keep the cache up to date, and
+# the version attribute makes set_dynamo_item fail on stale copies.
+CACHED_ENTITY_TYPES = (EntityType.organization, EntityType.user)
+# "client" runs queries on the low level client, decoding the items with
+# storage.codec, "resource" runs them on the table resource
+QUERY_BACKEND = os.environ.get("DYNAMODB_QUERY_BACKEND", "client")
+
+deserializer = TypeDeserializer()
+item_caches: dict[str, TTLCache[dict]] = {
+    entity_type.value: TTLCache(ITEM_CACHE_SIZE, ITEM_CACHE_TTL)
+    for entity_type in CACHED_ENTITY_TYPES
+}
+
+
+class BulkWriteResult(NamedTuple):
+    key: dict
+    success: bool
+    error: Optional[str] = None
 
 
 def get_dynamo_key(entityType: EntityType, entityId: ULID | str):
@@ -25,25 +83,193 @@ def get_dynamo_key(entityType: EntityType, entityId: ULID | str):
     }
 
 
-def get_dynamo_item(dynamo_key: dict, model: Type[M]):
-    item = table.get_item(Key=dynamo_key).get("Item")
+def _item_cache(key: Tuple[str, str]) -> Optional[TTLCache[dict]]:
+    return item_caches.get(key[1].split("#", 1)[0])
+
+
+def _cache_item(key: Tuple[str, str], item: Optional[dict]):
+    cache = _item_cache(key)
+    if cache is None:
+        return
     if item:
-        return to_model(item, model)
+        cache.put(key, copy.deepcopy(item))
+    else:
+        cache.discard(key)
+
+
+def _uncache_item(key: Tuple[str, str]):
+    cache = _item_cache(key)
+    if cache is not None:
+        cache.discard(key)
+
+
+def item_cache_stats() -> dict[str, dict[str, Any]]:
+    """Hit rate and size of the item cache of each cached entity type"""
+    return {entity_type: cache.stats() for entity_type, cache in item_caches.items()}
+
+
+def _read_item(dynamo_key: dict) -> Optional[dict]:
+    key = _key_tuple(dynamo_key)
+    cache = _item_cache(key)
+    if cache is not None:
+        item = cache.get(key)
+        if item is not None:
+            return copy.deepcopy(item)
+
+    # Through the client, as the executor reads orgs from worker threads and
+    # boto3 resources are not thread safe
+    client = dynamodb.meta.client
+    item = client.get_item(TableName=DYNAMODB_TABLE, Key=dynamo_key).get("Item")
+    if cache is not None and item:
+        cache.put(key, copy.deepcopy(item))
+    return item
+
+
+def _build_model(item: dict, model: Type[M], trusted: bool) -> M:
+    return to_trusted_model(item, model) if trusted else to_model(item, model)
+
+
+def get_dynamo_item(dynamo_key: dict, model: Type[M], trusted: bool = False):
+    """
+    Reads an item as a model. Trusted reads skip the validation of items
+    written by this code, see storage.trusted.
+    """
+    identity_map = get_identity_map()
+    if identity_map is None:
+        item = _read_item(dynamo_key)
+    else:
+        key = _key_tuple(dynamo_key)
+        item = identity_map.get(key)
+        if item is None:
+            item = _read_item(dynamo_key)
+            identity_map.put(key, item)
+
+    if item:
+        return _build_model(item, model, trusted)
 
     return None
 
 
-def get_dyanmo_index_item(index_name: str, condition: ConditionBase, model: Type[M]):
-    response = table.query(IndexName=index_name, KeyConditionExpression=condition)
+def _backoff(attempt: int):
+    """Full jitter exponential backoff, used when retrying unprocessed batches"""
+    time.sleep(random.uniform(0, BATCH_BACKOFF_BASE * 2**attempt))
+
+
+def _key_tuple(key: dict) -> Tuple[str, str]:
+    return (key["tenant"], key["entity"])
+
+
+def get_dynamo_items(
+    keys: Iterable[dict], model: Type[M], trusted: bool = False
+) -> List[Optional[M]]:
+    """
+    Reads many items with BatchGetItem. The result follows the order of keys,
+    with None for the items that don't exist. Duplicated keys are read once.
+    """
+    keys = [_key_tuple(k) for k in keys]
+    unique_keys = list(dict.fromkeys(keys))
+
+    found: dict[Tuple[str, str], dict] = {}
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        to_read = []
+        for key in unique_keys:
+            item = identity_map.get(key)
+            if item is None:
+                to_read.append(key)
+            elif item is not MISSING:
+                found[key] = item
+        unique_keys = to_read
+
+    for start in range(0, len(unique_keys), BATCH_GET_LIMIT):
+        chunk = unique_keys[start : start + BATCH_GET_LIMIT]
+        request: Optional[dict] = {
+            DYNAMODB_TABLE: {"Keys": [{"tenant": t, "entity": e} for t, e in chunk]}
+        }
+        attempt = 0
+        while request:
+            if attempt > BATCH_MAX_RETRIES:
+                raise InvalidState("Failed to read all items after retries")
+            if attempt:
+                _backoff(attempt)
+
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get("Responses", {}).get(DYNAMODB_TABLE, []):
+                found[_key_tuple(item)] = item
+
+            request = response.get("UnprocessedKeys")
+            attempt += 1
+
+    if identity_map is not None:
+        for key in unique_keys:
+            identity_map.put(key, found.get(key))
+
+    models = {k: _build_model(item, model, trusted) for k, item in found.items()}
+    return [models.get(k) for k in keys]
+
+
+def _client_query_args(query_args: dict) -> dict:
+    """Builds the expressions and encodes the values the resource would"""
+    builder = ConditionExpressionBuilder()
+    args: dict[str, Any] = {"TableName": DYNAMODB_TABLE}
+    names = dict(query_args.get("ExpressionAttributeNames", {}))
+    values = dict(query_args.get("ExpressionAttributeValues", {}))
+    for name, value in query_args.items():
+        if name in ("ExpressionAttributeNames", "ExpressionAttributeValues"):
+            continue
+        if isinstance(value, ConditionBase):
+            expression = builder.build_expression(
+                value, is_key_condition=name == "KeyConditionExpression"
+            )
+            args[name] = expression.condition_expression
+            names.update(expression.attribute_name_placeholders)
+            values.update(expression.attribute_value_placeholders)
+        elif name == "ExclusiveStartKey":
+            args[name] = encode_item(value)
+        else:
+            args[name] = value
+
+    if names:
+        args["ExpressionAttributeNames"] = names
+    if values:
+        args["ExpressionAttributeValues"] = encode_item(values)
+    return args
+
+
+def _query(
+    query_args: dict, model: Type[M], trusted: bool
+) -> Tuple[List[M], Optional[dict]]:
+    """One page of a query, as models, and its LastEvaluatedKey"""
+    if QUERY_BACKEND == "resource":
+        response = table.query(**query_args)
+        items = [_build_model(c, model, trusted) for c in response.get("Items", [])]
+        return items, response.get("LastEvaluatedKey")
+
+    response = client.query(**_client_query_args(query_args))
+    codec = get_codec(model)
+    items = []
+    for item in response.get("Items", []):
+        values = codec.decode(item)
+        if trusted:
+            items.append(to_trusted_model(values, model))
+        else:
+            # Already normalized, so to_model would only walk it again
+            items.append(model.model_validate(values))
+
+    last_key = response.get("LastEvaluatedKey")
+    return items, decode_item(last_key) if last_key else None
+
 
-    items = response.get("Items", [])
+def get_dyanmo_index_item(index_name: str, condition: ConditionBase, model: Type[M]):
+    query_args = {"IndexName": index_name, "KeyConditionExpression": condition}
+    items, _ = _query(query_args, model, trusted=False)
     if len(items) > 1:
         raise InvalidState(
             f"{len(items)} items was found in index {index_name} for the given key"
         )
 
     if items:
-        return to_model(items[0], model)
+        return items[0]
 
     return None
 
@@ -68,36 +294,28 @@ def _flatten_updates(
         out[prefix] = obj
 
 
-def update_dynamo_item(key: dict, update: dict, remove_paths: list[str] = []):
-    update.pop("tenant", None)
-    update.pop("entity", None)
-    update["updatedAt"] = utc_now_iso()
-
-    context_user = get_context_entity()
-    if not context_user:
-        raise InvalidState("No user is set to context during item update")
-    update["updatedBy"] = context_user.entity
-
-    flat: dict[tuple[str, ...], Any] = {}
-    for k, v in update.items():
-        _flatten_updates((k,), v, flat)
-
+@lru_cache(maxsize=UPDATE_EXPRESSION_CACHE_SIZE)
+def _compile_update_expression(
+    set_paths: Tuple[Tuple[str, ...], ...], remove_paths: Tuple[str, ...]
+) -> Tuple[str, dict[str, str]]:
+    """
+    UpdateExpression and ExpressionAttributeNames for the given paths. Values
+    are bound as :v0, :v1... in the order of set_paths. Callers send the same
+    shapes over and over, so they are only built once.
+    """
     set_clauses = []
     remove_clauses = []
     expr_names = {}
-    expr_vals = {}
-    for i, (path_tuple, value) in enumerate(flat.items()):
+    for i, path_tuple in enumerate(set_paths):
         name_placeholders = []
         for j, seg in enumerate(path_tuple):
             ph = f"#n{i}_{j}"
             name_placeholders.append(ph)
             expr_names[ph] = seg
         path_expr = ".".join(name_placeholders)
-        val_key = f":v{i}"
-        set_clauses.append(f"{path_expr} = {val_key}")
-        expr_vals[val_key] = value
+        set_clauses.append(f"{path_expr} = :v{i}")
 
-    start_idx = len(flat)
+    start_idx = len(set_paths)
     for k, dotted_path in enumerate(remove_paths):
         path_tuple = dotted_path.split(".")
         name_placeholders = []
@@ -108,29 +326,119 @@ def update_dynamo_item(key: dict, update: dict, remove_paths: list[str] = []):
         path_expr = ".".join(name_placeholders)
         remove_clauses.append(path_expr)
 
-    if not set_clauses and not remove_clauses:
-        return None
+    expr_names["#version"] = "version"
 
     parts = []
     if set_clauses:
         parts.append("SET " + ", ".join(set_clauses))
     if remove_clauses:
         parts.append("REMOVE " + ", ".join(remove_clauses))
+    parts.append("ADD #version :version")
+
+    return " ".join(parts), expr_names
 
-    update_expr = " ".join(parts)
 
-    resp = table.update_item(
-        Key=key,
-        UpdateExpression=update_expr,
-        ExpressionAttributeNames=expr_names,
-        ExpressionAttributeValues=expr_vals,
-        ReturnValues="ALL_NEW",
+def _build_update_args(update: dict, remove_paths: list[str]) -> Optional[dict]:
+    """Stamps the update and builds the expression arguments for update_item"""
+    update.pop("tenant", None)
+    update.pop("entity", None)
+    update.pop("version", None)
+    update["updatedAt"] = utc_now_iso()
+
+    context_user = get_context_entity()
+    if not context_user:
+        raise InvalidState("No user is set to context during item update")
+    update["updatedBy"] = context_user.entity
+
+    flat: dict[tuple[str, ...], Any] = {}
+    for k, v in update.items():
+        _flatten_updates((k,), v, flat)
+
+    if not flat and not remove_paths:
+        return None
+
+    update_expr, expr_names = _compile_update_expression(
+        tuple(flat), tuple(remove_paths)
     )
-    return resp.get("Attributes")
+    expr_vals = {f":v{i}": value for i, value in enumerate(flat.values())}
+    # Every update bumps the version, see set_dynamo_item
+    expr_vals[":version"] = 1
+
+    return {
+        "UpdateExpression": update_expr,
+        # Callers add their own names to it
+        "ExpressionAttributeNames": dict(expr_names),
+        "ExpressionAttributeValues": expr_vals,
+    }
+
+
+def update_dynamo_item(
+    key: dict,
+    update: dict,
+    remove_paths: list[str] = [],
+    return_values: str = "ALL_NEW",
+):
+    """
+    Sets the fields of update and removes remove_paths, returning the
+    attributes selected by return_values. Callers that don't use the result
+    should pass NONE, or UPDATED_NEW for just the updated attributes.
+    """
+    if return_values not in UPDATE_RETURN_VALUES:
+        raise ValueError(f"Unsupported ReturnValues {return_values}")
+
+    update_args = _build_update_args(update, remove_paths)
+    if not update_args:
+        return None
+
+    resp = table.update_item(Key=key, ReturnValues=return_values, **update_args)
+    attributes = resp.get("Attributes")
+    identity_map = get_identity_map()
+    if return_values == "ALL_NEW":
+        _cache_item(_key_tuple(key), attributes)
+        if identity_map is not None:
+            identity_map.put(_key_tuple(key), attributes)
+    else:
+        # Without the whole item, the copies can only be dropped
+        _uncache_item(_key_tuple(key))
+        if identity_map is not None:
+            identity_map.discard(_key_tuple(key))
+    return attributes
+
+
+def increment_dynamo_counter(key: dict, attribute: str, amount: int = 1) -> int:
+    """Atomically adds amount to a numeric attribute, returning its new value"""
+    try:
+        resp = table.update_item(
+            Key=key,
+            UpdateExpression="ADD #counter :amount, #version :version",
+            ConditionExpression=Attr("entity").exists(),
+            ExpressionAttributeNames={"#counter": attribute, "#version": "version"},
+            ExpressionAttributeValues={":amount": amount, ":version": 1},
+            ReturnValues="UPDATED_NEW",
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            raise InvalidState("Item does not exist for the given tenant/entity") from e
+        raise
+
+    value = resp["Attributes"][attribute]
+    _uncache_item(_key_tuple(key))
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        item = identity_map.get(_key_tuple(key))
+        if item:
+            item[attribute] = value
+            item["version"] = resp["Attributes"]["version"]
+            identity_map.put(_key_tuple(key), item)
+    return int(value)
 
 
 def set_dynamo_item(to_set: dict):
-    """Sets the fields to an existing item"""
+    """
+    Sets the fields to an existing item. The item must still have the version
+    it was read with, otherwise Conflict is raised, so changes made since the
+    read (or a stale cached copy) are not overwritten.
+    """
     to_set["updatedAt"] = utc_now_iso()
 
     context_user = get_context_entity()
@@ -141,20 +449,39 @@ def set_dynamo_item(to_set: dict):
     to_set["orgId"] = org_id
     to_set["tenant"] = f"ORG#{org_id}"
 
+    version = to_set.get("version")
+    condition = Attr("tenant").exists() & Attr("entity").exists()
+    if version:
+        condition &= Attr("version").eq(version)
+    else:
+        condition &= Attr("version").not_exists()
+    to_set["version"] = (version or 0) + 1
+
+    key = _key_tuple(to_set)
+    identity_map = get_identity_map()
     try:
         resp = table.put_item(
             Item=to_set,
-            ConditionExpression=Attr("tenant").exists() & Attr("entity").exists(),
+            ConditionExpression=condition,
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
         )
-        return resp.get("Attributes")
     except ClientError as e:
+        _uncache_item(key)
+        if identity_map is not None:
+            identity_map.discard(key)
         if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            if e.response.get("Item"):
+                raise Conflict("Item was changed since it was read") from e
             raise InvalidState("Item does not exist for the given tenant/entity") from e
         raise
 
+    _cache_item(key, to_set)
+    if identity_map is not None:
+        identity_map.put(key, to_set)
+    return resp.get("Attributes")
+
 
-def create_dynamo_item(item: dict, extra_condition: Optional[ConditionBase] = None):
-    context_user = get_context_entity()
+def _stamp_new_item(item: dict, context_user, created_at: str):
     org_id = str(context_user.orgId)
     if not org_id:
         raise ValueError("Item must have an org_id")
@@ -167,19 +494,27 @@ def create_dynamo_item(item: dict, extra_condition: Optional[ConditionBase] = No
     if not entity:
         raise ValueError("Item must have an entity")
 
-    item["createdAt"] = utc_now_iso()
+    item["createdAt"] = created_at
     item["createdBy"] = context_user.entity
 
+
+def create_dynamo_item(item: dict, extra_condition: Optional[ConditionBase] = None):
+    context_user = get_context_entity()
+    _stamp_new_item(item, context_user, utc_now_iso())
+
     condition: ConditionBase = Attr("tenant").not_exists() & Attr("entity").not_exists()
     if extra_condition is not None:
         condition &= extra_condition
 
+    identity_map = get_identity_map()
     try:
         table.put_item(
             Item=item,
             ConditionExpression=condition,
         )
     except ClientError as e:
+        if identity_map is not None:
+            identity_map.discard(_key_tuple(item))
         error_code = e.response.get("Error", {}).get("Code")
         if error_code == "ConditionalCheckFailedException":
             raise Conflict("Item already exists")
@@ -188,6 +523,132 @@ def create_dynamo_item(item: dict, extra_condition: Optional[ConditionBase] = No
             print(f"An unexpected error occurred: {error_code} - {error_message}")
             raise
 
+    _cache_item(_key_tuple(item), item)
+    if identity_map is not None:
+        identity_map.put(_key_tuple(item), item)
+
+
+def _write_batch(requests: List[dict]) -> dict[Tuple[str, str], str]:
+    """
+    Sends a single BatchWriteItem, retrying the unprocessed items. Returns the
+    keys that could not be written, mapped to the reason.
+    """
+    client = dynamodb.meta.client
+    pending: List[dict] = requests
+    attempt = 0
+    while pending:
+        if attempt > BATCH_MAX_RETRIES:
+            break
+        if attempt:
+            _backoff(attempt)
+
+        try:
+            response = client.batch_write_item(RequestItems={DYNAMODB_TABLE: pending})
+        except ClientError as e:
+            error = e.response.get("Error", {})
+            reason = f"{error.get('Code')} - {error.get('Message')}"
+            return {_request_key(r): reason for r in pending}
+
+        pending = response.get("UnprocessedItems", {}).get(DYNAMODB_TABLE, [])
+        attempt += 1
+
+    return {_request_key(r): "Unprocessed after retries" for r in pending}
+
+
+def _request_key(request: dict) -> Tuple[str, str]:
+    if "PutRequest" in request:
+        return _key_tuple(request["PutRequest"]["Item"])
+    return _key_tuple(request["DeleteRequest"]["Key"])
+
+
+def _bulk_write(requests: List[dict]) -> dict[Tuple[str, str], str]:
+    batches = [
+        requests[start : start + BATCH_WRITE_LIMIT]
+        for start in range(0, len(requests), BATCH_WRITE_LIMIT)
+    ]
+    failed: dict[Tuple[str, str], str] = {}
+    with ThreadPoolExecutor(max_workers=BATCH_WRITE_WORKERS) as pool:
+        for batch_failed in pool.map(_write_batch, batches):
+            failed.update(batch_failed)
+    return failed
+
+
+def bulk_create_items(items: List[dict]) -> List[BulkWriteResult]:
+    """
+    Writes many new items with concurrent BatchWriteItem calls. Items are
+    stamped like in create_dynamo_item, but BatchWriteItem does not support
+    conditions, so an existing item with the same key is overwritten.
+    Returns one result per item, in input order.
+    """
+    context_user = get_context_entity()
+    created_at = utc_now_iso()
+
+    requests = []
+    duplicated = set()
+    seen = set()
+    for item in items:
+        _stamp_new_item(item, context_user, created_at)
+        key = _key_tuple(item)
+        if key in seen:
+            duplicated.add(id(item))
+            continue
+        seen.add(key)
+        requests.append({"PutRequest": {"Item": item}})
+
+    failed = _bulk_write(requests)
+
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        for request in requests:
+            item = request["PutRequest"]["Item"]
+            key = _key_tuple(item)
+            if key in failed:
+                identity_map.discard(key)
+            else:
+                identity_map.put(key, item)
+
+    for request in requests:
+        _uncache_item(_key_tuple(request["PutRequest"]["Item"]))
+
+    results = []
+    for item in items:
+        key = _key_tuple(item)
+        if id(item) in duplicated:
+            error: Optional[str] = "Duplicated key in request"
+        else:
+            error = failed.get(key)
+        results.append(
+            BulkWriteResult({"tenant": key[0], "entity": key[1]}, error is None, error)
+        )
+    return results
+
+
+def bulk_delete_items(keys: List[dict]) -> List[BulkWriteResult]:
+    """Deletes many items with concurrent BatchWriteItem calls"""
+    unique_keys = list(dict.fromkeys(_key_tuple(k) for k in keys))
+    requests = [
+        {"DeleteRequest": {"Key": {"tenant": t, "entity": e}}} for t, e in unique_keys
+    ]
+
+    failed = _bulk_write(requests)
+
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        for key in unique_keys:
+            if key in failed:
+                identity_map.discard(key)
+            else:
+                identity_map.put(key, None)
+
+    for key in unique_keys:
+        _uncache_item(key)
+
+    results = []
+    for key in keys:
+        error = failed.get(_key_tuple(key))
+        results.append(BulkWriteResult(key, error is None, error))
+    return results
+
 
 def patch_dict(whole: dict, to_patch: dict, ignore_nulls: bool = True):
     whole.update(
@@ -207,37 +668,224 @@ def fill_dict(filling: dict, filler: dict):
 
 def delete_dynamo_item(key: dict):
     table.delete_item(Key=key)
+    _uncache_item(_key_tuple(key))
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        identity_map.put(_key_tuple(key), None)
 
 
-def list_dynamo_entity(entity_type: EntityType, model: Type[M]):
+def _context_tenant():
     user = get_context_entity()
     org_id = str(user.orgId)
     if not org_id:
         raise ValueError("Item must have an org_id")
 
-    org_key = f"ORG#{org_id}"
+    return f"ORG#{org_id}"
+
+
+def _entity_condition(entity_type: EntityType):
+    org_key = _context_tenant()
     entity_key = f"{entity_type.value}#"
-    condition = Key("tenant").eq(org_key) & Key("entity").begins_with(entity_key)
+    return Key("tenant").eq(org_key) & Key("entity").begins_with(entity_key)
+
+
+def iter_dynamo_entity(
+    entity_type: EntityType,
+    model: Type[M],
+    page_size: Optional[int] = None,
+    trusted: bool = False,
+) -> Iterator[M]:
+    condition = _entity_condition(entity_type)
+    return iter_dynamo_items(condition, model, page_size=page_size, trusted=trusted)
+
+
+def list_dynamo_entity(
+    entity_type: EntityType,
+    model: Type[M],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    trusted: bool = False,
+):
+    condition = _entity_condition(entity_type)
+    return list_dynamo_page(
+        condition,
+        model,
+        limit=limit,
+        cursor=cursor,
+        trusted=trusted,
+        scope=entity_type.value,
+    )
 
-    return list_dynamo_items(condition, model)
+
+def iter_dynamo_pages(
+    condition: ConditionBase,
+    model: Type[M],
+    page_size: Optional[int] = None,
+    trusted: bool = False,
+    **kwargs,
+) -> Iterator[List[M]]:
+    """
+    Lazily queries the table, following LastEvaluatedKey until the results are
+    exhausted. Each yielded list holds the validated models of a single page.
+    page_size is sent as the query Limit, so filtered queries may yield fewer
+    items per page.
+    """
+    query_args: dict[str, Any] = {
+        "KeyConditionExpression": condition,
+        **kwargs,
+    }
+    if page_size:
+        query_args["Limit"] = page_size
+
+    while True:
+        items, last_key = _query(query_args, model, trusted)
+        if items:
+            yield items
+
+        if not last_key:
+            return
+        query_args["ExclusiveStartKey"] = last_key
+
+
+def iter_dynamo_items(
+    condition: ConditionBase,
+    model: Type[M],
+    page_size: Optional[int] = None,
+    trusted: bool = False,
+    **kwargs,
+) -> Iterator[M]:
+    pages = iter_dynamo_pages(
+        condition, model, page_size=page_size, trusted=trusted, **kwargs
+    )
+    for page in pages:
+        yield from page
 
 
 def list_dynamo_items(
     condition: ConditionBase,
     model: Type[M],
+    trusted: bool = False,
     **kwargs,
 ):
+    return list(iter_dynamo_items(condition, model, trusted=trusted, **kwargs))
+
+
+def list_dynamo_page(
+    condition: ConditionBase,
+    model: Type[M],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    trusted: bool = False,
+    scope: Optional[str] = None,
+    **kwargs,
+) -> Tuple[List[M], Optional[str]]:
+    """
+    Reads up to limit items (or everything, when no limit is given) starting
+    from cursor. Returns the items and the cursor for the next page, which is
+    None once the results are exhausted. Cursors are only accepted by listings
+    of the same scope, by default the index queried.
+    """
+    if limit is not None and limit < 1:
+        raise InvalidData("Limit must be a positive number")
+
+    tenant = _context_tenant()
+    if scope is None:
+        scope = kwargs.get("IndexName", DYNAMODB_TABLE)
     query_args: dict[str, Any] = {
         "KeyConditionExpression": condition,
+        **kwargs,
     }
+    if cursor:
+        query_args["ExclusiveStartKey"] = decode_cursor(cursor, tenant, scope)
+
+    items: List[M] = []
+    while True:
+        if limit:
+            query_args["Limit"] = limit - len(items)
+
+        page, last_key = _query(query_args, model, trusted)
+        items.extend(page)
 
-    response = table.query(**query_args, **kwargs)
+        if not last_key:
+            return items, None
+        if limit and len(items) >= limit:
+            return items, encode_cursor(last_key, tenant, scope)
+        query_args["ExclusiveStartKey"] = last_key
 
-    if response.get("LastEvaluatedKey"):
-        # TODO: SNS here, as it's not yet supported
-        print("Pagination is expected, user data is now incomplete")
 
-    return [to_model(c, model) for c in response["Items"]]
+def create_operation(item: dict) -> dict:
+    """
+    Transaction counterpart of create_dynamo_item. On a conflict, the
+    cancellation reason carries the existing item.
+    """
+    context_user = get_context_entity()
+    _stamp_new_item(item, context_user, utc_now_iso())
+    return {
+        "Put": {
+            "TableName": DYNAMODB_TABLE,
+            "Item": item,
+            "ConditionExpression": NEW_ITEM_CONDITION,
+            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+        }
+    }
+
+
+def update_operation(
+    key: dict,
+    update: dict,
+    remove_paths: list[str] = [],
+    expected: Optional[dict[str, Any]] = None,
+) -> dict:
+    """
+    Transaction counterpart of update_dynamo_item. expected maps attributes to
+    the values they must currently hold; when they don't, the cancellation
+    reason carries the current item.
+    """
+    update_args = _build_update_args(update, remove_paths)
+    if not update_args:
+        raise ValueError("Update operation has nothing to update")
+
+    operation = {"TableName": DYNAMODB_TABLE, "Key": key, **update_args}
+    if expected:
+        conditions = []
+        for i, (attribute, value) in enumerate(expected.items()):
+            operation["ExpressionAttributeNames"][f"#e{i}"] = attribute
+            operation["ExpressionAttributeValues"][f":e{i}"] = value
+            conditions.append(f"#e{i} = :e{i}")
+        operation["ConditionExpression"] = " AND ".join(conditions)
+        operation["ReturnValuesOnConditionCheckFailure"] = "ALL_OLD"
+
+    return {"Update": operation}
+
+
+def transact_write_dynamo_items(operations: List[dict]):
+    """
+    Runs all operations in a single TransactWriteItems. When the transaction is
+    canceled, raises TransactionCanceled with one reason per operation, in
+    order, each with its Code and the returned Item, if any.
+    """
+    # Whatever happens, the items in the operations may have changed
+    identity_map = get_identity_map()
+    for operation in operations:
+        for action in operation.values():
+            key = _key_tuple(action.get("Key") or action.get("Item"))
+            _uncache_item(key)
+            if identity_map is not None:
+                identity_map.discard(key)
+
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=operations)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "TransactionCanceledException":
+            raise
+
+        reasons = []
+        for reason in e.response.get("CancellationReasons", []):
+            item = reason.get("Item")
+            if item:
+                item = {k: deserializer.deserialize(v) for k, v in item.items()}
+            reasons.append({"Code": reason.get("Code"), "Item": item})
+        raise TransactionCanceled(reasons=reasons) from e
 
 
 def _lock_entity_key(entity_type: EntityType, idempotency_key: str) -> str:
@@ -248,7 +896,7 @@ def get_lock(tenant: str, entity: str):
     return table.get_item(Key={"tenant": tenant, "entity": entity}).get("Item")
 
 
-def acquire_idempotency_lock(
+def _build_lock_item(
     entity_type: EntityType,
     lock_key: str,
     target_entity: Optional[str] = None,
@@ -278,6 +926,37 @@ def acquire_idempotency_lock(
     if metadata:
         item["metadata"] = metadata
 
+    return item
+
+
+def idempotency_lock_operation(
+    entity_type: EntityType,
+    lock_key: str,
+    target_entity: Optional[str] = None,
+    metadata: Optional[dict[str, Any]] = None,
+) -> dict:
+    """Transaction counterpart of acquire_idempotency_lock"""
+    item = _build_lock_item(entity_type, lock_key, target_entity, metadata)
+    return {
+        "Put": {
+            "TableName": DYNAMODB_TABLE,
+            "Item": item,
+            "ConditionExpression": NEW_ITEM_CONDITION,
+            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+        }
+    }
+
+
+def acquire_idempotency_lock(
+    entity_type: EntityType,
+    lock_key: str,
+    target_entity: Optional[str] = None,
+    metadata: Optional[dict[str, Any]] = None,
+) -> dict:
+    item = _build_lock_item(entity_type, lock_key, target_entity, metadata)
+    tenant = item["tenant"]
+    entity = item["entity"]
+
     try:
         table.put_item(
             Item=item,
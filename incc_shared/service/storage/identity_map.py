@@ -0,0 +1,59 @@
+import copy
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+ItemKey = Tuple[str, str]
+
+# Marks an item known not to exist, as opposed to one that was never read
+MISSING: dict = {}
+
+
+class IdentityMap:
+    """
+    Items read or written during a unit of work, keyed by (tenant, entity), so
+    the same item is read from DynamoDB at most once. Items are kept as the raw
+    DynamoDB dicts and copied on the way in and out, so models built from them
+    can be changed freely.
+    """
+
+    def __init__(self):
+        self.items: Dict[ItemKey, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: ItemKey) -> Optional[dict]:
+        """The cached item, MISSING if it doesn't exist, or None if unknown"""
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return item if item is MISSING else copy.deepcopy(item)
+
+    def put(self, key: ItemKey, item: Optional[dict]):
+        self.items[key] = copy.deepcopy(item) if item else MISSING
+
+    def discard(self, key: ItemKey):
+        self.items.pop(key, None)
+
+
+_identity_map: ContextVar[Optional[IdentityMap]] = ContextVar(
+    "identity_map", default=None
+)
+
+
+def get_identity_map() -> Optional[IdentityMap]:
+    return _identity_map.get()
+
+
+@contextmanager
+def unit_of_work():
+    """Runs the block with a new, empty identity map"""
+    identity_map = IdentityMap()
+    token = _identity_map.set(identity_map)
+    try:
+        yield identity_map
+    finally:
+        _identity_map.reset(token)
@@ -0,0 +1,226 @@
+"""
+Trusted reads: models built from items this code wrote and validated, without
+validating them again. Values are only converted to the types of the fields
+(ISO strings to dates, strings to ULIDs and enums, nested dicts to models) and
+the models are created like model_construct does, so constraints, after validators
+and model validators (canonicalize_keys included) don't run.
+
+A sample of the trusted reads is also fully validated, so items that no longer
+match the models show up in the logs.
+"""
+
+import os
+import random
+import types
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+from ulid import ULID
+
+from incc_shared.service.storage.base import M, to_model
+
+# Fraction of the trusted reads that are also fully validated
+TRUSTED_READ_SAMPLE_RATE = float(os.environ.get("TRUSTED_READ_SAMPLE_RATE", "0.01"))
+
+Converter = Callable[[Any], Any]
+# Defaults that can be shared between instances instead of copied
+IMMUTABLE = (type(None), bool, int, str, Decimal, date, Enum, ULID)
+
+ULID_CACHE_SIZE = 4096
+
+coercers: Dict[type, Callable[[dict], Any]] = {}
+trusted_read_stats = {"reads": 0, "sampled": 0, "drifts": 0}
+
+
+def _as_is(v: Any) -> Any:
+    return v
+
+
+def _to_int(v: Any) -> Any:
+    return int(v) if isinstance(v, Decimal) else v
+
+
+def _to_decimal(v: Any) -> Any:
+    return Decimal(v) if isinstance(v, (int, str)) else v
+
+
+def _to_date(v: Any) -> Any:
+    return date.fromisoformat(v) if isinstance(v, str) else v
+
+
+def _to_datetime(v: Any) -> Any:
+    return datetime.fromisoformat(v) if isinstance(v, str) else v
+
+
+# Parsing a ULID costs more than the rest of an item, and the same ids (payers,
+# orgs) come back in every page of a list
+_parse_ulid = lru_cache(maxsize=ULID_CACHE_SIZE)(ULID.from_str)
+
+
+def _to_ulid(v: Any) -> Any:
+    return _parse_ulid(v) if isinstance(v, str) else v
+
+
+def _enum_converter(enum: Type[Enum]) -> Converter:
+    members = enum._value2member_map_
+
+    def convert(v: Any) -> Any:
+        member = members.get(v)
+        if member is None:
+            return v if isinstance(v, enum) else enum(v)
+        return member
+
+    return convert
+
+
+def _model_converter(model: Type[BaseModel]) -> Converter:
+    def convert(v: Any) -> Any:
+        return get_coercer(model)(v) if isinstance(v, dict) else v
+
+    return convert
+
+
+def _list_converter(item: Converter) -> Converter:
+    if item is _as_is:
+        return lambda v: list(v) if isinstance(v, (set, tuple)) else v
+
+    def convert(v: Any) -> Any:
+        if isinstance(v, (list, set, tuple)):
+            return [item(x) for x in v]
+        return v
+
+    return convert
+
+
+def _optional_converter(inner: Converter) -> Converter:
+    if inner is _as_is:
+        return inner
+
+    def convert(v: Any) -> Any:
+        return None if v is None else inner(v)
+
+    return convert
+
+
+def _converter(annotation: Any) -> Converter:
+    origin = get_origin(annotation)
+    if origin in (Union, types.UnionType):
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) != 1:
+            return _as_is
+        return _optional_converter(_converter(args[0]))
+    if origin in (list, List, set, tuple):
+        args = get_args(annotation)
+        return _list_converter(_converter(args[0]) if args else _as_is)
+
+    if not isinstance(annotation, type):
+        return _as_is
+    # bool is a subclass of int, and datetime of date
+    if annotation is bool:
+        return _as_is
+    if issubclass(annotation, Enum):
+        return _enum_converter(annotation)
+    if issubclass(annotation, BaseModel):
+        return _model_converter(annotation)
+    if issubclass(annotation, datetime):
+        return _to_datetime
+    if issubclass(annotation, date):
+        return _to_date
+    if issubclass(annotation, int):
+        return _to_int
+    if issubclass(annotation, Decimal):
+        return _to_decimal
+    if issubclass(annotation, ULID):
+        return _to_ulid
+    return _as_is
+
+
+def _default_getter(field: FieldInfo) -> Callable[[dict], Any]:
+    if field.default_factory is None and isinstance(field.default, IMMUTABLE):
+        default = field.default
+        return lambda values: default
+    return lambda values: field.get_default(
+        call_default_factory=True, validated_data=values
+    )
+
+
+def _compile_coercer(model: Type[M]) -> Callable[[dict], M]:
+    before_validators: Dict[str, List[Converter]] = {}
+    # Pydantic runs the before validators of a field from the last defined one
+    for decorator in reversed(
+        list(model.__pydantic_decorators__.field_validators.values())
+    ):
+        if decorator.info.mode == "before":
+            for name in decorator.info.fields:
+                before_validators.setdefault(name, []).append(decorator.func)
+
+    fields = []
+    for name, field in model.model_fields.items():
+        default = None if field.is_required() else _default_getter(field)
+        validators = before_validators.get(name, [])
+        fields.append((name, validators, _converter(field.annotation), default))
+    post_init = bool(model.__pydantic_post_init__)
+    new = model.__new__
+    setattr_ = object.__setattr__
+
+    def coerce(item: dict) -> M:
+        # Same as model_construct, which spends more time looking for aliases
+        # than these items take to convert
+        values = {}
+        fields_set = set()
+        for name, validators, convert, default in fields:
+            if name in item:
+                value = item[name]
+                for validator in validators:
+                    value = validator(value)
+                values[name] = convert(value)
+                fields_set.add(name)
+            elif default is not None:
+                values[name] = default(values)
+
+        instance = new(model)
+        setattr_(instance, "__dict__", values)
+        setattr_(instance, "__pydantic_fields_set__", fields_set)
+        setattr_(instance, "__pydantic_extra__", None)
+        setattr_(instance, "__pydantic_private__", None)
+        if post_init:
+            instance.model_post_init(None)
+        return instance
+
+    return coerce
+
+
+def get_coercer(model: Type[M]) -> Callable[[dict], M]:
+    """Builds models of the given class from trusted items"""
+    coercer = coercers.get(model)
+    if coercer is None:
+        coercer = coercers[model] = _compile_coercer(model)
+    return coercer
+
+
+def to_trusted_model(data: dict, model: Type[M]) -> M:
+    trusted_read_stats["reads"] += 1
+    trusted = get_coercer(model)(data)
+    if random.random() >= TRUSTED_READ_SAMPLE_RATE:
+        return trusted
+
+    trusted_read_stats["sampled"] += 1
+    try:
+        validated = to_model(data, model)
+    except Exception as e:
+        trusted_read_stats["drifts"] += 1
+        print(f"Trusted {model.__name__} item failed validation: {e}")
+        raise
+
+    if validated.model_dump() != trusted.model_dump():
+        trusted_read_stats["drifts"] += 1
+        print(
+            f"Trusted {model.__name__} item differs from the validated one: "
+            f"{data.get('tenant')} {data.get('entity')}"
+        )
+    return validated
@@ -1,4 +1,5 @@
-from typing import TYPE_CHECKING
+import os
+from typing import TYPE_CHECKING, Any, Optional
 
 import boto3
 from boto3.dynamodb.conditions import Key
@@ -14,6 +15,7 @@ from incc_shared.models.db.indexes.email_index import EmailIndexModel
 from incc_shared.models.db.user import UserModel
 from incc_shared.models.feature import Feature, Resource
 from incc_shared.models.request.user.create import CreateUserModel
+from incc_shared.service.cache import TTLCache
 from incc_shared.service.organization import get_org
 from incc_shared.service.storage.dynamodb import (
     create_dynamo_item,
@@ -28,6 +30,15 @@ if TYPE_CHECKING:
     from mypy_boto3_cognito_idp.type_defs import AdminCreateUserResponseTypeDef
 
 BASE_FEATURES = [Feature.read(Resource.org)]
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "60"))  # seconds
+# Users not fully registered yet are remembered for less time, since they are
+# expected to show up soon
+USER_NEGATIVE_CACHE_TTL = int(os.environ.get("USER_NEGATIVE_CACHE_TTL", "5"))
+
+NOT_REGISTERED: Any = object()
+user_index_cache: TTLCache[UserIndexModel] = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+user_index_queries = 0
 
 
 def get_sub(cognito_user: "AdminCreateUserResponseTypeDef"):
@@ -82,12 +93,15 @@ def create_user(model: CreateUserModel):
         user.features.append(Feature.write(Resource.org))
 
     create_dynamo_item(user.to_item())
+    user_index_cache.discard(user_id)
 
     return user_id
 
 
-def list_users():
-    return list_dynamo_entity(EntityType.user, UserModel)
+def list_users(limit: Optional[int] = None, cursor: Optional[str] = None):
+    return list_dynamo_entity(
+        EntityType.user, UserModel, limit=limit, cursor=cursor, trusted=True
+    )
 
 
 def get_user(username: str):
@@ -95,10 +109,39 @@ def get_user(username: str):
     return get_dynamo_item(key, UserModel)
 
 
-def get_user_by_username(username: str):
+def get_user_by_username(username: str) -> Optional[UserIndexModel]:
+    """
+    User index record of username, cached for USER_CACHE_TTL seconds. Users
+    that are not registered are cached for USER_NEGATIVE_CACHE_TTL seconds.
+    """
+    global user_index_queries
+
+    cached = user_index_cache.get(username)
+    if cached is NOT_REGISTERED:
+        return None
+    if cached is not None:
+        return cached.model_copy(deep=True)
+
     user_key = f"USER#{username}"
     condition = Key("gsi_user_pk").eq(user_key)
-    return get_dyanmo_index_item("user_index", condition, UserIndexModel)
+    user = get_dyanmo_index_item("user_index", condition, UserIndexModel)
+    user_index_queries += 1
+
+    if user is None:
+        user_index_cache.put(username, NOT_REGISTERED, ttl=USER_NEGATIVE_CACHE_TTL)
+        return None
+
+    user_index_cache.put(username, user.model_copy(deep=True))
+    return user
+
+
+def user_cache_stats():
+    """Hit rate of the user index cache and the GSI queries it saved"""
+    return {
+        **user_index_cache.stats(),
+        "gsiQueries": user_index_queries,
+        "gsiQueriesSaved": user_index_cache.hits,
+    }
 
 
 def get_user_by_email(email: EmailStr):
@@ -110,3 +153,4 @@ def get_user_by_email(email: EmailStr):
 def delete_user(user_id: str):
     key = get_dynamo_key(EntityType.user, user_id)
     delete_dynamo_item(key)
+    user_index_cache.discard(user_id)
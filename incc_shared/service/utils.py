@@ -1,4 +1,6 @@
+import calendar
 from datetime import date, datetime
+from functools import lru_cache
 
 
 def format_date(raw_date: date):
@@ -7,3 +9,37 @@ def format_date(raw_date: date):
 
 def format_datetime(raw_datetime: datetime):
     return raw_datetime.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def month_ordinal(raw_date: date) -> int:
+    """Months since year 0, so month arithmetic is integer arithmetic"""
+    return raw_date.year * 12 + raw_date.month - 1
+
+
+@lru_cache(maxsize=4096)
+def days_in_month(ordinal: int) -> int:
+    year, month = divmod(ordinal, 12)
+    return calendar.monthrange(year, month + 1)[1]
+
+
+def month_date(ordinal: int, day: int = 1) -> date:
+    """
+    The day of the month with the given ordinal, clamped to the last day of
+    the month like relativedelta does
+    """
+    year, month = divmod(ordinal, 12)
+    if day > 28:
+        day = min(day, days_in_month(ordinal))
+    return date(year, month + 1, day)
+
+
+def add_months(raw_date: date, months: int) -> date:
+    """Same as raw_date + relativedelta(months=months)"""
+    return month_date(month_ordinal(raw_date) + months, raw_date.day)
+
+
+@lru_cache(maxsize=4096)
+def month_key(ordinal: int) -> str:
+    """First day of the month as dd/mm/yyyy, the INCC history date format"""
+    year, month = divmod(ordinal, 12)
+    return f"01/{month + 1:02d}/{year:04d}"
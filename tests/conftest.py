@@ -18,7 +18,8 @@ from incc_shared.models.request.schedule.create import CreateScheduleModel
 from incc_shared.service.customer import create_customer, delete_customer, get_customer
 from incc_shared.service.organization import get_org
 from incc_shared.service.schedule import create_schedule, delete_schedule, get_schedule
-from incc_shared.service.user import get_sub
+from incc_shared.service.storage.dynamodb import item_caches
+from incc_shared.service.user import get_sub, user_index_cache
 
 today = date.today()
 
@@ -181,6 +182,10 @@ def clean_table_between_tests(table: Table):
                 continue
             bw.delete_item(Key={"tenant": it["tenant"], "entity": it["entity"]})
     yield
+    # Items are deleted behind the storage layer, so it can't keep its cache
+    for cache in item_caches.values():
+        cache.clear()
+    user_index_cache.clear()
     # also delete after test (in case test added items)
     resp = table.scan(ProjectionExpression="tenant, entity, email")
     items = resp.get("Items", [])
@@ -0,0 +1,206 @@
+import itertools
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from cognitojwt.exceptions import CognitoJWTException
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from freezegun import freeze_time
+from jose import jwk, jwt
+from pydantic import ValidationError
+
+from incc_shared.auth import tokens
+from incc_shared.auth.context import get_context_entity, set_context_entity
+from incc_shared.auth.decorators import required_permissions
+from incc_shared.handler.http import create_response
+from incc_shared.models.feature import (
+    Action,
+    Feature,
+    PermissionedEntity,
+    Resource,
+    Scope,
+    compile_required,
+)
+from incc_shared.service.cache import TTLCache
+from incc_shared.service.storage.base import table
+
+
+def generate_key(kid: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+    return pem, {**public, "kid": kid, "use": "sig"}
+
+
+def sign(pem: str, kid: str, **claims):
+    claims = {
+        "username": str(get_context_entity().id),
+        "token_use": "access",
+        "client_id": os.environ["COGNITO_CLIENT_ID"],
+        "exp": int(time.time()) + 300,
+        **claims,
+    }
+    return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.fixture
+def jwks(tmp_path, monkeypatch):
+    path = tmp_path / "jwks.json"
+    monkeypatch.setenv("AWS_COGNITO_JWKS_PATH", str(path))
+    monkeypatch.setattr(tokens, "jwks_cache", None)
+    monkeypatch.setattr(tokens, "verified_tokens", TTLCache(16, ttl=0))
+
+    def publish(*keys):
+        path.write_text(json.dumps({"keys": list(keys)}))
+
+    return publish
+
+
+def test_verify_token(jwks):
+    pem, public = generate_key("k1")
+    jwks(public)
+
+    token = sign(pem, "k1")
+    claims = tokens.verify_token(token)
+    assert claims["username"] == str(get_context_entity().id)
+
+    # Verified once, then served from the cache
+    assert tokens.verify_token(token) == claims
+    assert tokens.verified_tokens.stats()["hits"] == 1
+    assert tokens.get_jwks().fetches == 1
+
+    header, payload, signature = token.split(".")
+    tampered = jwt.encode({**claims, "username": "x"}, pem, algorithm="RS256")
+    with pytest.raises(CognitoJWTException):
+        tokens.verify_token(".".join([header, tampered.split(".")[1], signature]))
+
+    with pytest.raises(CognitoJWTException):
+        tokens.verify_token(sign(pem, "k1", client_id="other"))
+
+    # Cached tokens still expire
+    with freeze_time(datetime.now() + timedelta(minutes=10)):
+        with pytest.raises(CognitoJWTException):
+            tokens.verify_token(token)
+
+
+def test_jwks_rotation(jwks, monkeypatch):
+    pem, public = generate_key("k1")
+    jwks(public)
+    tokens.verify_token(sign(pem, "k1"))
+
+    # Unknown kids refetch the keys, but at most once per interval
+    new_pem, new_public = generate_key("k2")
+    jwks(public, new_public)
+    with pytest.raises(CognitoJWTException):
+        tokens.verify_token(sign(new_pem, "k2"))
+    assert tokens.get_jwks().fetches == 1
+
+    monkeypatch.setattr(tokens, "JWKS_MIN_REFRESH_INTERVAL", 0)
+    assert tokens.verify_token(sign(new_pem, "k2"))
+    assert tokens.get_jwks().fetches == 2
+
+    with pytest.raises(CognitoJWTException):
+        tokens.verify_token(sign(new_pem, "unknown"))
+
+
+def test_required_permissions(jwks):
+    pem, public = generate_key("k1")
+    jwks(public)
+
+    # Registered user, as found through the user index
+    user = get_context_entity()
+    user_id = str(uuid.uuid4())
+    table.put_item(
+        Item={
+            **user.to_item(),
+            "id": user_id,
+            "entity": f"USER#{user_id}",
+            "email": "jane.doe@example.com",
+            "gsi_user_pk": f"USER#{user_id}",
+            "gsi_org_sk": f"ORG#{user.orgId}",
+        }
+    )
+
+    @required_permissions([Feature.read(Resource.org)])
+    def handle(event, context):
+        return create_response({"user": get_context_entity().entity})
+
+    token = sign(pem, "k1", username=user_id)
+    event = {"headers": {"Authorization": f"Bearer {token}"}}
+    for _ in range(2):
+        response = handle(event, None)
+        assert response["statusCode"] == 200
+        assert response["body"] == json.dumps({"user": f"USER#{user_id}"})
+    assert tokens.verified_tokens.stats()["hits"] == 1
+    set_context_entity(user)
+
+    expired = sign(pem, "k1", username=user_id, exp=1)
+    event = {"headers": {"Authorization": f"Bearer {expired}"}}
+    assert handle(event, None)["statusCode"] == 401
+
+
+def has_permission_original(features, action, resource, scope):
+    required = scope or Scope.org
+    for f in features:
+        if f.action == action and f.resource == resource:
+            if (f.scope or Scope.org).includes(required):
+                return True
+    return False
+
+
+def test_compiled_permissions():
+    all_features = [
+        Feature(action=a, resource=r, scope=s)
+        for a in Action
+        for r in Resource
+        for s in [None, *Scope]
+    ]
+    tenant = f"ORG#{get_context_entity().orgId}"
+    for granted in itertools.combinations(all_features, 2):
+        entity = PermissionedEntity(tenant=tenant, features=list(granted))
+        for f in all_features:
+            expected = has_permission_original(granted, f.action, f.resource, f.scope)
+            assert entity.has_permission(f) == expected
+            assert entity.has_permission(f.action, f.resource, f.scope) == expected
+
+        required = all_features[::7]
+        mask = compile_required(required)
+        assert entity.has_permissions(mask, "any") == any(
+            has_permission_original(granted, f.action, f.resource, f.scope)
+            for f in required
+        )
+        assert entity.has_permissions(mask, "all") == all(
+            has_permission_original(granted, f.action, f.resource, f.scope)
+            for f in required
+        )
+
+    # Changes to the features are picked up
+    entity = PermissionedEntity(tenant=tenant, features=[])
+    assert not entity.has_permission(Feature.write(Resource.org))
+    entity.features.append(Feature.write(Resource.org, Scope.all))
+    assert entity.has_permission(Feature.write(Resource.org))
+    entity.features = [Feature.read(Resource.org)]
+    assert not entity.has_permission(Feature.write(Resource.org))
+    assert entity.model_copy().has_permission(Feature.read(Resource.org))
+
+    # Including changes that keep the length of the list
+    entity = PermissionedEntity(
+        tenant=tenant, features=[Feature.write(Resource.org, Scope.all)]
+    )
+    assert entity.has_permission(Feature.write(Resource.org))
+    entity.features[0] = Feature.from_string("read:org")
+    assert not entity.has_permission(Feature.write(Resource.org))
+    assert entity.has_permission(Feature.read(Resource.org))
+    entity.features.remove(entity.features[0])
+    entity.features.append(Feature.read(Resource.customer))
+    assert not entity.has_permission(Feature.read(Resource.org))
+    with pytest.raises(ValidationError):
+        entity.features[0].action = Action.write
@@ -1,10 +1,29 @@
 from datetime import timedelta
 from decimal import Decimal
 
+import pytest
+from pydantic import ValidationError
+
+from incc_shared.auth.context import get_context_entity
+from incc_shared.constants import EntityType
+from incc_shared.models.db.boleto.base import StatusBoleto
+from incc_shared.models.db.boleto.boleto import BoletoModel
+from incc_shared.models.db.customer import CustomerModel
+from incc_shared.models.db.schedule.schedule import ScheduleModel
+from incc_shared.models.db.user.user import UserModel
 from incc_shared.models.request.boleto.create import CreateBoletoModel
 from incc_shared.models.request.boleto.update import UpdateBoletoModel
-from incc_shared.service.boleto import create_boleto, get_boleto, update_boleto
+from incc_shared.models.serializer import dump_value
+from incc_shared.service.boleto import (
+    create_boleto,
+    get_boleto,
+    list_boletos,
+    update_boleto,
+)
 from incc_shared.service.organization import get_org
+from incc_shared.service.storage import trusted
+from incc_shared.service.storage.base import table, to_model
+from incc_shared.service.storage.dynamodb import get_dynamo_item, get_dynamo_key
 
 
 def test_create_boleto(boleto_data: dict):
@@ -39,3 +58,93 @@ def test_create_boleto(boleto_data: dict):
     assert updated_boleto != boleto
     assert updated_boleto.valor == update_data["valor"]
     assert updated_boleto.vencimento == update_data["vencimento"]
+
+
+def test_canonical_keys(
+    monkeypatch,
+    boleto_data: dict,
+    test_customer: CustomerModel,
+    test_schedule: ScheduleModel,
+):
+    nosso_numero = create_boleto(CreateBoletoModel(**boleto_data))
+    user = get_context_entity()
+    items = [
+        (
+            BoletoModel,
+            table.get_item(Key=get_dynamo_key(EntityType.boleto, nosso_numero)),
+        ),
+        (CustomerModel, test_customer.to_item()),
+        (ScheduleModel, test_schedule.to_item()),
+        (UserModel, user.to_item()),
+    ]
+    for model, item in items:
+        item = item.get("Item", item)
+        item.pop("entity")
+        fast = to_model(item, model)
+        with monkeypatch.context() as m:
+            # Dumping the whole model, as before the inputs were introspected
+            m.setattr(model, "_canonical_inputs", None)
+            dumped = to_model(item, model)
+        assert fast.entity
+        assert fast.to_item() == dumped.to_item()
+
+
+def test_trusted_reads(
+    monkeypatch,
+    boleto_data: dict,
+    test_customer: CustomerModel,
+    test_schedule: ScheduleModel,
+):
+    monkeypatch.setattr(trusted, "TRUSTED_READ_SAMPLE_RATE", 0)
+    nosso_numero = create_boleto(CreateBoletoModel(**boleto_data))
+    user = get_context_entity()
+
+    boletos, _ = list_boletos()
+    assert boletos[0].model_dump() == get_boleto(nosso_numero).model_dump()
+    assert isinstance(boletos[0].juros.valor, Decimal)
+
+    for model, entity_type, entity_id in [
+        (BoletoModel, EntityType.boleto, nosso_numero),
+        (CustomerModel, EntityType.customer, test_customer.customerId),
+        (ScheduleModel, EntityType.schedule, test_schedule.id),
+        (UserModel, EntityType.user, user.id),
+    ]:
+        key = get_dynamo_key(entity_type, entity_id)
+        fast = get_dynamo_item(key, model, trusted=True)
+        validated = get_dynamo_item(key, model)
+        assert fast.model_dump() == validated.model_dump()
+        assert fast.to_item() == validated.to_item()
+
+    # A sampled read is validated, so items that drifted from the model fail
+    key = get_dynamo_key(EntityType.boleto, nosso_numero)
+    table.update_item(Key=key, UpdateExpression="REMOVE pagador")
+    assert get_dynamo_item(key, BoletoModel, trusted=True)
+
+    monkeypatch.setattr(trusted, "TRUSTED_READ_SAMPLE_RATE", 1)
+    drifts = trusted.trusted_read_stats["drifts"]
+    with pytest.raises(ValidationError):
+        get_dynamo_item(key, BoletoModel, trusted=True)
+    assert trusted.trusted_read_stats["drifts"] == drifts + 1
+
+
+def test_to_item(boleto_data: dict, test_schedule: ScheduleModel):
+    nosso_numero = create_boleto(CreateBoletoModel(**boleto_data))
+    boleto = get_boleto(nosso_numero)
+    assert isinstance(boleto.to_item()["valor"], Decimal)
+
+    def as_json(value):
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, dict):
+            return {k: as_json(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [as_json(v) for v in value]
+        return value
+
+    for model in [boleto, test_schedule, get_context_entity(), get_org()]:
+        for exclude_none in (True, False):
+            item = model.to_item(exclude_none=exclude_none)
+            dumped = model.model_dump(mode="json", exclude_none=exclude_none)
+            assert as_json(item) == dumped
+
+    assert dump_value(StatusBoleto.pago) == "PAGO"
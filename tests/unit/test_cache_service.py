@@ -0,0 +1,29 @@
+from freezegun import freeze_time
+
+from incc_shared.service.cache import TTLCache
+
+
+def test_ttl_cache():
+    with freeze_time("2025-01-01 00:00:00") as frozen:
+        cache: TTLCache[str] = TTLCache(maxsize=2, ttl=10)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        assert cache.get("a") == "1"
+
+        # "b" is the least recently used
+        cache.put("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("c") == "3"
+
+        cache.put("a", "4", ttl=20)
+        frozen.tick(15)
+        assert cache.get("c") is None
+        assert cache.get("a") == "4"
+
+        assert cache.stats() == {
+            "size": 1,
+            "hits": 3,
+            "misses": 2,
+            "evictions": 1,
+            "hitRate": 0.6,
+        }
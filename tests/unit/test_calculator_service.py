@@ -1,7 +1,87 @@
+import itertools
+import json
 from datetime import date
 from decimal import Decimal
 
-from incc_shared.service.calculator import calcula_valor
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from dateutil.relativedelta import relativedelta
+from freezegun import freeze_time
+
+from incc_shared.exceptions.errors import InvalidState
+from incc_shared.service import calculator
+from incc_shared.service.calculator import (
+    BUCKET,
+    KEY,
+    MAX_PARCELAS,
+    INCCHistoryCache,
+    calcula_reajuste,
+    calcula_valor,
+    calcula_valores,
+    formata_data_indice,
+    get_incc_list,
+    get_incc_map,
+    iter_reajuste,
+)
+from incc_shared.service.incc_snapshot import build_snapshot, read_snapshot
+
+VALORES = [Decimal("1000"), Decimal("0.01"), Decimal("1234.56"), Decimal("99999.99")]
+
+
+def calcula_valor_original(valor, data_inicio, data_fim=None):
+    """Month by month calculation the cumulative factors must match"""
+    data_atual = data_inicio.replace(day=1)
+    data_fim = data_fim.replace(day=1) if data_fim else None
+    lista_incc = get_incc_map()
+    resultado = valor
+    for _ in range(MAX_PARCELAS):
+        if data_fim and data_atual >= data_fim:
+            break
+
+        data_indice = formata_data_indice(data_atual)
+        try:
+            incc = Decimal(lista_incc[data_indice])
+            resultado = resultado * (1 + incc / 100)
+        except KeyError:
+            break
+        data_atual += relativedelta(months=1)
+    else:
+        raise InvalidState("Limite de calculo atingido")
+
+    return round(resultado, 2)
+
+
+def calcula_reajuste_original(valor, data_inicio):
+    lista_incc = get_incc_map()
+    data_atual = data_inicio.replace(day=1)
+    reajustes = [
+        {"data_parcela": data_inicio, "data_incc": None, "incc": None, "valor": valor}
+    ]
+    ultima_parcela = valor
+    for i in range(MAX_PARCELAS):
+        try:
+            incc = Decimal(lista_incc[formata_data_indice(data_atual)])
+        except KeyError:
+            break
+        ultima_parcela = round(ultima_parcela * (1 + incc / 100), 2)
+        reajustes.append(
+            {
+                "data_parcela": data_inicio + relativedelta(months=i + 1),
+                "data_incc": data_atual,
+                "incc": incc,
+                "valor": ultima_parcela,
+            }
+        )
+        data_atual += relativedelta(months=1)
+    else:
+        raise InvalidState("Limite de calculo atingido")
+    return reajustes
+
+
+def history_months():
+    primeiro = date(1994, 10, 1)
+    return [primeiro + relativedelta(months=i) for i in range(len(get_incc_list()))]
 
 
 def test_calculator():
@@ -13,4 +93,248 @@ def test_calculator():
     assert resultado == esperado
 
 
-# TODO: Write tests for calcula_reajuste
+def test_calcula_valor_parity():
+    meses = history_months()
+    mapa = get_incc_map()
+    fora = [meses[0] - relativedelta(months=1), meses[-1] + relativedelta(months=1)]
+
+    for i, inicio in enumerate([fora[0], *meses, fora[1]]):
+        data_inicio = inicio.replace(day=15)
+
+        # Every end month, accumulating the reference month by month
+        valor = VALORES[i % len(VALORES)]
+        resultado = valor
+        data_fim = inicio
+        for _ in range(len(meses) + 2):
+            assert calcula_valor(valor, data_inicio, data_fim) == round(resultado, 2)
+            incc = mapa.get(formata_data_indice(data_fim))
+            if incc is None:
+                break
+            resultado = resultado * (1 + Decimal(incc) / 100)
+            data_fim += relativedelta(months=1)
+
+        assert calcula_valor(valor, data_inicio) == round(resultado, 2)
+        if i % 24 == 0:
+            for valor in VALORES:
+                esperado = calcula_valor_original(valor, data_inicio)
+                assert calcula_valor(valor, data_inicio) == esperado
+
+        assert calcula_valor(valor, data_inicio, inicio - relativedelta(months=3)) == (
+            round(valor, 2)
+        )
+
+
+def synthetic_history(valores, inicio=date(2000, 1, 1)):
+    return [
+        {"data": formata_data_indice(inicio + relativedelta(months=i)), "valor": v}
+        for i, v in enumerate(valores)
+    ]
+
+
+def test_calcula_valor_half_cent(monkeypatch):
+    # 0.01 * 1.5 is exactly half a cent, rounded to even
+    history = synthetic_history(["50.00", "0.00"])
+    monkeypatch.setattr(calculator, "get_incc_list", lambda: history)
+
+    data_inicio = date(2000, 1, 1)
+    assert calcula_valor(Decimal("0.01"), data_inicio) == Decimal("0.02")
+    assert calcula_valor(Decimal("0.03"), data_inicio) == Decimal("0.04")
+    for valor in [Decimal("0.01"), Decimal("0.03"), Decimal("0.05")]:
+        assert calcula_valor(valor, data_inicio) == calcula_valor_original(
+            valor, data_inicio
+        )
+
+
+def test_calcula_valor_limit(monkeypatch):
+    history = synthetic_history(["0.10"] * (MAX_PARCELAS + 10))
+    monkeypatch.setattr(calculator, "get_incc_list", lambda: history)
+
+    data_inicio = date(2000, 1, 1)
+    with pytest.raises(InvalidState):
+        calcula_valor_original(Decimal("10"), data_inicio)
+    with pytest.raises(InvalidState):
+        calcula_valor(Decimal("10"), data_inicio)
+
+    data_fim = data_inicio + relativedelta(months=MAX_PARCELAS - 1)
+    assert calcula_valor(Decimal("10"), data_inicio, data_fim) == (
+        calcula_valor_original(Decimal("10"), data_inicio, data_fim)
+    )
+
+
+def test_calcula_valores():
+    meses = history_months()
+    pares = [
+        (
+            VALORES[i % len(VALORES)] + i,
+            meses[(i * 7) % len(meses)].replace(day=i % 28 + 1),
+        )
+        for i in range(500)
+    ]
+    data_fim = date(2025, 6, 10)
+
+    resultados = calcula_valores(pares, data_fim=data_fim)
+    assert resultados == [calcula_valor(v, d, data_fim=data_fim) for v, d in pares]
+    assert calcula_valores([]) == []
+
+
+def test_incc_history_cache():
+    s3 = boto3.client("s3")
+    history = INCCHistoryCache(BUCKET, KEY, ttl=0)
+
+    lista = history.get()
+    assert lista == get_incc_list()
+    assert history.stats()["refreshes"] == 1
+
+    # Unchanged object: revalidated with a 304, same list kept
+    assert history.get() is lista
+    assert history.stats()["not_modified"] == 1
+    assert history.stats()["version"] == 1
+
+    with open("tests/history.json") as f:
+        original = f.read()
+    novo = synthetic_history(["1.00"])
+    try:
+        s3.put_object(Bucket=BUCKET, Key=KEY, Body=json.dumps(novo))
+        assert history.get() == novo
+        assert history.stats()["version"] == 2
+
+        # S3 failing keeps the stale copy
+        s3.delete_object(Bucket=BUCKET, Key=KEY)
+        assert history.get() == novo
+        assert history.stats()["errors"] == 1
+    finally:
+        s3.put_object(Bucket=BUCKET, Key=KEY, Body=original)
+
+    cached = INCCHistoryCache(BUCKET, KEY, ttl=3600)
+    cached.get()
+    cached.get()
+    assert cached.stats()["hits"] == 1
+    assert cached.stats()["misses"] == 1
+
+    with pytest.raises(ClientError):
+        INCCHistoryCache(BUCKET, "missing.json", ttl=0).get()
+
+
+def test_incc_snapshot(monkeypatch):
+    with open("tests/history.json") as f:
+        history = json.load(f)
+
+    snapshot = read_snapshot(build_snapshot(history))
+    assert snapshot.history == history
+
+    gaps = synthetic_history(["0.10", "-0.25", "1.5"])
+    del gaps[1]
+    assert read_snapshot(build_snapshot(gaps)).history == [
+        {"data": "01/01/2000", "valor": "0.10"},
+        {"data": "01/03/2000", "valor": "1.50"},
+    ]
+
+    def s3_unavailable():
+        raise ClientError({"Error": {"Code": "500"}}, "GetObject")
+
+    snapshot = read_snapshot(build_snapshot(gaps))
+    monkeypatch.setattr(calculator, "incc_snapshot", snapshot)
+    monkeypatch.setattr(calculator.incc_history, "get", s3_unavailable)
+
+    # Up to date snapshot, S3 is not read
+    with freeze_time("2000-04-20"):
+        assert get_incc_list() is snapshot.history
+
+    # Outdated snapshot, S3 is read and the snapshot is the fallback
+    with freeze_time("2000-05-20"):
+        assert get_incc_list() is snapshot.history
+    monkeypatch.setattr(calculator.incc_history, "get", lambda: history)
+    with freeze_time("2000-05-20"):
+        assert get_incc_list() is history
+
+
+def test_calcula_reajuste():
+    meses = history_months()
+    for i, inicio in enumerate(meses[::12] + [meses[-1], date(1990, 1, 1)]):
+        data_inicio = inicio.replace(day=31 if inicio.month == 1 else 15)
+        valor = VALORES[i % len(VALORES)]
+        resultado = calcula_reajuste(valor, data_inicio)
+        assert resultado["data_inicio"] == data_inicio
+        assert resultado["valor_original"] == valor
+        assert resultado["reajustes"] == calcula_reajuste_original(valor, data_inicio)
+
+
+def test_iter_reajuste(monkeypatch):
+    data_inicio = date(2020, 1, 10)
+    primeiras = list(itertools.islice(iter_reajuste(Decimal("1000"), data_inicio), 3))
+    assert primeiras == calcula_reajuste_original(Decimal("1000"), data_inicio)[:3]
+
+    history = synthetic_history(["0.10"] * (MAX_PARCELAS + 10))
+    monkeypatch.setattr(calculator, "get_incc_list", lambda: history)
+    parcelas = iter_reajuste(Decimal("10"), date(2000, 1, 1))
+    assert len(list(itertools.islice(parcelas, MAX_PARCELAS + 1))) == MAX_PARCELAS + 1
+    with pytest.raises(InvalidState):
+        next(parcelas)
+
+
+def test_parcelas_centavos():
+    indice = calculator.get_indice_incc()
+    valores = VALORES + [Decimal("0.05"), Decimal("12.345"), Decimal("7.1234567")]
+    for inicio in range(0, len(indice.incc), 5):
+        for valor in valores:
+            centavos = list(
+                calculator._parcelas_centavos(indice, valor, inicio, len(indice.incc))
+            )
+            decimal = list(
+                calculator._parcelas_decimal(indice, valor, inicio, len(indice.incc))
+            )
+            assert centavos == decimal
+            assert [str(v) for v in centavos] == [str(v) for v in decimal]
+
+    # Half cents, rounded to even at every step
+    indice = calculator.IndiceINCC(synthetic_history(["50.00", "-50.00", "50.00"]))
+    for valor in [Decimal("0.01"), Decimal("0.03"), Decimal("0.05"), Decimal("0.5")]:
+        assert list(calculator._parcelas_centavos(indice, valor, 0, 3)) == list(
+            calculator._parcelas_decimal(indice, valor, 0, 3)
+        )
+
+
+def test_calcula_reajuste_decimal_fallback():
+    valor = Decimal("123456789012345.678")
+    reajustes = calcula_reajuste(valor, date(2000, 1, 1))["reajustes"]
+    assert reajustes == calcula_reajuste_original(valor, date(2000, 1, 1))
+
+
+def test_calcula_reajuste_int(monkeypatch):
+    monkeypatch.setattr(calculator, "reajuste_cache", calculator.OrderedDict())
+    data_inicio = date(2020, 1, 15)
+    resultado = calcula_reajuste(1234, data_inicio)
+    assert resultado["valor_original"] == Decimal("1234")
+    assert resultado["reajustes"] == calcula_reajuste_original(
+        Decimal("1234"), data_inicio
+    )
+    assert list(iter_reajuste(1234, data_inicio)) == resultado["reajustes"]
+    assert calcula_reajuste(Decimal("1234"), data_inicio) == resultado
+
+
+def test_calcula_reajuste_cache(monkeypatch):
+    monkeypatch.setattr(calculator, "reajuste_cache", calculator.OrderedDict())
+    monkeypatch.setattr(calculator, "reajuste_stats", {"hits": 0, "misses": 0})
+    monkeypatch.setattr(calculator, "REAJUSTE_CACHE_SIZE", 2)
+
+    data_inicio = date(2024, 1, 1)
+    primeiro = calcula_reajuste(Decimal("1000"), data_inicio)
+    primeiro["reajustes"][1]["valor"] = Decimal(0)
+    assert calcula_reajuste(Decimal("1000"), data_inicio)["reajustes"][1]["valor"]
+    assert calculator.reajuste_stats == {"hits": 1, "misses": 1}
+
+    calcula_reajuste(Decimal("1000.00"), data_inicio)
+    calcula_reajuste(Decimal("2000"), data_inicio)
+    assert len(calculator.reajuste_cache) == 2
+    assert calculator.reajuste_stats == {"hits": 1, "misses": 3}
+
+    # A new history isn't served from the results of the previous one
+    history = synthetic_history(["1.00"] * 3, inicio=date(2024, 1, 1))
+    monkeypatch.setattr(calculator, "get_incc_list", lambda: history)
+    reajustes = calcula_reajuste(Decimal("2000"), data_inicio)["reajustes"]
+    assert [r["valor"] for r in reajustes] == [
+        Decimal("2000"),
+        Decimal("2020.00"),
+        Decimal("2040.20"),
+        Decimal("2060.60"),
+    ]
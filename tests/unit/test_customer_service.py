@@ -1,12 +1,38 @@
+import base64
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from freezegun import freeze_time
+from ulid import ULID
+
+from incc_shared.auth.context import impersonate
+from incc_shared.constants import EntityType
+from incc_shared.exceptions.errors import InvalidData
+from incc_shared.handler.decorators import handler
+from incc_shared.handler.http import create_response
 from incc_shared.models.db.customer import CustomerModel
+from incc_shared.models.request.customer.create import CreateCustomerModel
 from incc_shared.models.request.customer.update import UpdateCustomerModel
+from incc_shared.service.boleto import list_boletos
 from incc_shared.service.customer import (
+    create_customer,
+    create_customers,
     delete_customer,
+    delete_customers,
     get_customer,
+    get_customers,
+    iter_customers,
     list_customers,
     update_customer,
 )
-from incc_shared.service.storage.base import to_model
+from incc_shared.service.storage import dynamodb as storage
+from incc_shared.service.storage.base import normalize_item, to_model
+from incc_shared.service.storage.codec import encode_item, get_codec
+from incc_shared.service.storage.cursor import CURSOR_TTL
+from incc_shared.service.storage.dynamodb import _entity_condition, iter_dynamo_pages
+from incc_shared.service.storage.identity_map import get_identity_map, unit_of_work
 
 
 def test_customer_lifecycle(
@@ -26,7 +52,7 @@ def test_customer_lifecycle(
     customer = get_customer(test_customer.customerId)
     assert customer is not None
 
-    customers = list_customers()
+    customers, _ = list_customers()
     assert len(customers) == 2
     ids = [test_customer.customerId, test_customer_2.customerId]
     for c in customers:
@@ -46,3 +72,207 @@ def test_customer_lifecycle(
 
     delete_customer(test_customer.customerId)
     assert get_customer(test_customer.customerId) is None
+
+
+def test_customer_pagination(customer_data: dict):
+    ids = {create_customer(CreateCustomerModel(**customer_data)) for _ in range(5)}
+
+    condition = _entity_condition(EntityType.customer)
+    pages = list(iter_dynamo_pages(condition, CustomerModel, page_size=2))
+    assert [len(p) for p in pages] == [2, 2, 1]
+
+    assert {c.customerId for c in iter_customers(page_size=2)} == ids
+    customers, next_cursor = list_customers()
+    assert next_cursor is None
+    assert {c.customerId for c in customers} == ids
+
+    page, cursor = list_customers(limit=2)
+    seen = [c.customerId for c in page]
+    while cursor:
+        page, cursor = list_customers(limit=2, cursor=cursor)
+        assert len(page) <= 2
+        seen += [c.customerId for c in page]
+    assert len(seen) == len(ids)
+    assert set(seen) == ids
+
+
+def test_customer_cursor_tampering(customer_data: dict):
+    for _ in range(3):
+        create_customer(CreateCustomerModel(**customer_data))
+
+    _, cursor = list_customers(limit=1)
+    assert cursor
+
+    _, signature = cursor.split(".")
+    forged = base64.urlsafe_b64encode(b'{"key":{},"tenant":"ORG#x"}').decode()
+    with pytest.raises(InvalidData):
+        list_customers(limit=1, cursor=f"{forged}.{signature}")
+
+    with pytest.raises(InvalidData):
+        list_customers(limit=1, cursor="garbage")
+
+    with impersonate(ULID()):
+        with pytest.raises(InvalidData):
+            list_customers(limit=1, cursor=cursor)
+
+    # Cursors only work for the listing they came from
+    with pytest.raises(InvalidData):
+        list_boletos(limit=1, cursor=cursor)
+
+    # and expire
+    with freeze_time(timedelta(seconds=CURSOR_TTL + 1), tick=True):
+        with pytest.raises(InvalidData):
+            list_customers(limit=1, cursor=cursor)
+    assert list_customers(limit=1, cursor=cursor)
+
+
+def test_get_customers(test_customer: CustomerModel, test_customer_2: CustomerModel):
+    missing = [ULID() for _ in range(150)]
+    ids = [test_customer_2.customerId, *missing, test_customer.customerId]
+    ids.append(test_customer_2.customerId)
+
+    customers = get_customers(ids)
+    assert len(customers) == len(ids)
+    assert customers[0] == test_customer_2
+    assert customers[-2] == test_customer
+    assert customers[-1] == test_customer_2
+    assert all(c is None for c in customers[1:-2])
+
+
+def test_get_customers_retries_unprocessed(monkeypatch, test_customer: CustomerModel):
+    resource = storage.dynamodb
+    calls = []
+
+    class ThrottledResource:
+        def batch_get_item(self, RequestItems):
+            calls.append(RequestItems)
+            if len(calls) == 1:
+                return {"Responses": {}, "UnprocessedKeys": RequestItems}
+            return resource.batch_get_item(RequestItems=RequestItems)
+
+    monkeypatch.setattr(storage, "dynamodb", ThrottledResource())
+    monkeypatch.setattr(storage, "BATCH_BACKOFF_BASE", 0)
+
+    assert get_customers([test_customer.customerId]) == [test_customer]
+    assert len(calls) == 2
+
+
+def test_bulk_customers(customer_data: dict):
+    models = [CreateCustomerModel(**customer_data) for _ in range(60)]
+    created = create_customers(models)
+    assert len(created) == len(models)
+    assert all(result.success for _, result in created)
+
+    customers, _ = list_customers()
+    assert len(customers) == len(models)
+    for customer in customers:
+        assert customer.createdAt
+        assert customer.createdBy
+
+    ids = [customerId for customerId, _ in created]
+    results = delete_customers(ids + ids[:1])
+    assert len(results) == len(ids) + 1
+    assert all(result.success for result in results)
+
+    customers, _ = list_customers()
+    assert customers == []
+
+
+def test_identity_map(monkeypatch, customer_data: dict):
+    client = storage.dynamodb.meta.client
+    get_item = client.get_item
+    reads = []
+
+    def counting_get_item(**kwargs):
+        reads.append(kwargs["Key"])
+        return get_item(**kwargs)
+
+    monkeypatch.setattr(client, "get_item", counting_get_item)
+
+    customer_id = create_customer(CreateCustomerModel(**customer_data))
+    with unit_of_work() as identity_map:
+        customer = get_customer(customer_id)
+        assert customer
+        customer.nome = "Changed locally"
+        assert get_customer(customer_id).nome == customer_data["nome"]
+        assert len(reads) == 1
+
+        update_customer(customer_id, UpdateCustomerModel(nome="Ciclano"))
+        assert get_customer(customer_id).nome == "Ciclano"
+        assert get_customers([customer_id])[0].nome == "Ciclano"
+
+        # Impersonating starts a unit of work of its own
+        with impersonate(ULID()):
+            assert get_identity_map() not in (None, identity_map)
+        assert get_identity_map() is identity_map
+
+        delete_customer(customer_id)
+        assert get_customer(customer_id) is None
+        assert len(reads) == 1
+
+        created_id = create_customer(CreateCustomerModel(**customer_data))
+        assert get_customer(created_id)
+        assert len(reads) == 1
+        assert identity_map.hits == 5
+
+    assert get_identity_map() is None
+    assert get_customer(created_id)
+    assert len(reads) == 2
+    delete_customer(created_id)
+
+    @handler()
+    def handle(event, context):
+        return create_response({"active": get_identity_map() is not None})
+
+    assert handle({}, None)["body"] == '{"active": true}'
+
+
+def test_query_backends(monkeypatch, customer_data: dict):
+    for _ in range(5):
+        create_customer(CreateCustomerModel(**customer_data))
+
+    results = {}
+    for backend in ("resource", "client"):
+        monkeypatch.setattr(storage, "QUERY_BACKEND", backend)
+        page, cursor = list_customers(limit=3)
+        rest, _ = list_customers(cursor=cursor)
+        results[backend] = [c.model_dump() for c in page + rest]
+    assert len(results["client"]) == 5
+    assert results["client"] == results["resource"]
+
+    # A cursor from one backend works on the other
+    _, cursor = list_customers(limit=2)
+    monkeypatch.setattr(storage, "QUERY_BACKEND", "resource")
+    rest, _ = list_customers(cursor=cursor)
+    assert len(rest) == 3
+
+
+def test_codec(customer_data: dict):
+    customer = CustomerModel(**customer_data, customerId=ULID())
+    item = {
+        **customer.to_item(),
+        "version": 3,
+        "saldo": Decimal("12.50"),
+        "inteiro": Decimal("7"),
+        "tags": {"a", "b"},
+        "ativo": True,
+        "vazio": None,
+        "lista": [1, "x", {"y": Decimal("0.1")}],
+    }
+
+    serializer = TypeSerializer()
+    wire = {k: serializer.serialize(v) for k, v in item.items()}
+    encoded = encode_item(item)
+    assert {k: v for k, v in encoded.items() if k != "tags"} == {
+        k: v for k, v in wire.items() if k != "tags"
+    }
+    assert sorted(encoded["tags"]["SS"]) == sorted(wire["tags"]["SS"])
+
+    deserializer = TypeDeserializer()
+    expected = normalize_item({k: deserializer.deserialize(v) for k, v in wire.items()})
+    decoded = get_codec(CustomerModel).decode(wire)
+    assert sorted(decoded.pop("tags")) == sorted(expected.pop("tags"))
+    assert decoded == expected
+    validated = CustomerModel.model_validate(decoded)
+    assert validated.version == 3
+    assert validated.model_copy(update={"version": None}) == customer
@@ -1,14 +1,32 @@
+import threading
 from datetime import date
+from threading import Lock
 
+import pytest
 from dateutil.relativedelta import relativedelta
 from freezegun import freeze_time
+from ulid import ULID
 
-from incc_shared.admin.service.executor import execute_schedules
-from incc_shared.admin.service.schedule import list_schedules_for_date
+from incc_shared.admin.service import executor
+from incc_shared.admin.service.executor import (
+    ScheduleFailed,
+    execute_schedules,
+    failure_report,
+    merge_failure_reports,
+    run_schedule,
+)
+from incc_shared.admin.service.organization import create_organization
+from incc_shared.admin.service.schedule import list_schedules_for_date, shard_of
+from incc_shared.auth.context import impersonate
+from incc_shared.exceptions.errors import TransactionCanceled
 from incc_shared.models.db.schedule import ScheduleModel
 from incc_shared.models.db.schedule.base import ScheduleStatus
-from incc_shared.service.boleto import list_boletos
-from incc_shared.service.schedule import get_schedule
+from incc_shared.models.request.schedule.create import CreateScheduleModel
+from incc_shared.service.boleto import get_boleto, list_boletos
+from incc_shared.service.organization import get_org, reserve_nosso_numeros
+from incc_shared.service.schedule import create_schedule, get_schedule
+from incc_shared.service.storage import dynamodb as storage
+from incc_shared.service.storage.base import table
 from tests.conftest import SCHEDULE_DATE
 
 data_execucao = SCHEDULE_DATE
@@ -49,7 +67,7 @@ def test_executor_lifecycle(
     )
     assert updated_schedule_balao.parcelasEmitidas == 1
 
-    boletos = list_boletos()
+    boletos, _ = list_boletos()
     assert len(boletos) == 2
 
     remaining = updated_schedule.parcelas - updated_schedule.parcelasEmitidas - 1
@@ -86,3 +104,161 @@ def test_executor_lifecycle(
 
     # TODO write tests for:
     # - Non-active schedules
+
+
+@freeze_time(data_execucao)
+def test_run_schedule_transaction(test_schedule: ScheduleModel):
+    (schedule,) = list_schedules_for_date(date.today())
+    org = get_org()
+    assert org
+
+    # A number taken outside the executor makes the first attempt fail
+    (taken,) = reserve_nosso_numeros()
+    assert taken == org.nossoNumero
+
+    nosso_numero = run_schedule(schedule, org)
+    assert nosso_numero == taken + 1
+    assert org.nossoNumero == taken + 2
+
+    boleto = get_boleto(nosso_numero)
+    assert boleto
+    assert boleto.agendamento == f"{schedule.id}#1"
+
+    updated_org = get_org()
+    assert updated_org
+    assert updated_org.nossoNumero == org.nossoNumero
+
+    updated_schedule = get_schedule(schedule.id)
+    assert updated_schedule
+    assert updated_schedule.parcelasEmitidas == 1
+
+    # Running the same installment again is a no-op
+    assert run_schedule(schedule, org) is None
+    boletos, _ = list_boletos()
+    assert len(boletos) == 1
+    updated_org = get_org()
+    assert updated_org
+    assert updated_org.nossoNumero == org.nossoNumero
+
+
+@freeze_time(data_execucao)
+def test_run_schedule_cancellation_reasons(monkeypatch, test_schedule: ScheduleModel):
+    (schedule,) = list_schedules_for_date(date.today())
+    org = get_org()
+    assert org
+    transact = executor.transact_write_dynamo_items
+    canceled = []
+
+    def cancel(operations):
+        reasons = canceled.pop(0)
+        if reasons is None:
+            return transact(operations)
+        raise TransactionCanceled(reasons=reasons)
+
+    monkeypatch.setattr(executor, "transact_write_dynamo_items", cancel)
+
+    # Reasons that don't match the operations are not guessed at
+    canceled.append([])
+    with pytest.raises(TransactionCanceled):
+        run_schedule(schedule, org)
+
+    # Conflicts with other writes are retried
+    conflict = [{"Code": "None", "Item": None}] * 4
+    conflict[2] = {"Code": "TransactionConflict", "Item": None}
+    canceled += [conflict, None]
+    assert run_schedule(schedule, org) == org.nossoNumero - 1
+    assert not canceled
+
+    updated_schedule = get_schedule(schedule.id)
+    assert updated_schedule
+    assert updated_schedule.parcelasEmitidas == 1
+
+
+@freeze_time(data_execucao)
+def test_parallel_executor(monkeypatch, schedule_data: dict):
+    # moto's TransactWriteItems is not thread safe, so only it is serialized
+    lock = Lock()
+    transact = executor.transact_write_dynamo_items
+
+    def locked_transact(operations):
+        with lock:
+            return transact(operations)
+
+    monkeypatch.setattr(executor, "transact_write_dynamo_items", locked_transact)
+
+    # The table resource is not thread safe, workers must go through clients
+    class MainThreadTable:
+        def __getattr__(self, name):
+            assert threading.current_thread() is threading.main_thread()
+            return getattr(table, name)
+
+    monkeypatch.setattr(storage, "table", MainThreadTable())
+
+    orgs = {}
+    for _ in range(4):
+        org_id = create_organization()
+        with impersonate(org_id):
+            orgs[org_id] = [
+                create_schedule(CreateScheduleModel(**schedule_data)) for _ in range(3)
+            ]
+
+    # Schedules of an org that does not exist fail as a whole
+    orphan_org = ULID()
+    with impersonate(orphan_org):
+        for _ in range(2):
+            create_schedule(CreateScheduleModel(**schedule_data))
+
+    # So that the workers read the orgs from the table
+    for cache in storage.item_caches.values():
+        cache.clear()
+
+    with pytest.raises(ScheduleFailed) as e:
+        execute_schedules(page_size=2, max_workers=3)
+
+    assert list(e.value.failures) == [orphan_org]
+    assert len(e.value.failures[orphan_org]) == 2
+    assert len(list_schedules_for_date(date.today())) == 2
+    for org_id, schedule_ids in orgs.items():
+        with impersonate(org_id):
+            for schedule_id in schedule_ids:
+                schedule = get_schedule(schedule_id)
+                assert schedule
+                assert schedule.parcelasEmitidas == 1
+
+            boletos, _ = list_boletos()
+            assert sorted(b.nossoNumero for b in boletos) == [1, 2, 3]
+            org = get_org()
+            assert org
+            assert org.nossoNumero == 4
+
+
+@freeze_time(data_execucao)
+def test_sharded_executor(schedule_data: dict):
+    total_shards = 3
+    orgs = {}
+    for _ in range(6):
+        org_id = create_organization()
+        with impersonate(org_id):
+            orgs[org_id] = create_schedule(CreateScheduleModel(**schedule_data))
+
+    orphan_org = ULID()
+    with impersonate(orphan_org):
+        create_schedule(CreateScheduleModel(**schedule_data))
+
+    reports = []
+    for shard in range(total_shards):
+        try:
+            execute_schedules(shard=shard, total_shards=total_shards)
+        except ScheduleFailed as e:
+            assert shard == shard_of(f"ORG#{orphan_org}", total_shards)
+            reports.append(failure_report(e))
+
+    with pytest.raises(ScheduleFailed) as e:
+        merge_failure_reports(reports)
+    assert list(e.value.failures) == [str(orphan_org)]
+
+    for org_id, schedule_id in orgs.items():
+        with impersonate(org_id):
+            schedule = get_schedule(schedule_id)
+            assert schedule
+            assert schedule.parcelasEmitidas == 1
@@ -1,15 +1,23 @@
 import pytest
 
-from incc_shared.exceptions.errors import InvalidState
+from incc_shared.constants import EntityType
+from incc_shared.exceptions.errors import Conflict, InvalidData, InvalidState
 from incc_shared.models.common import TipoDocumento
 from incc_shared.models.request.organization.org_setup import SetupOrgModel
 from incc_shared.models.request.organization.update import UpdateOrganizationModel
 from incc_shared.service.organization import (
     get_org,
+    reserve_nosso_numeros,
     setup_organization,
     update_organization,
 )
-from incc_shared.service.storage.base import to_model
+from incc_shared.service.storage.base import table, to_model
+from incc_shared.service.storage.dynamodb import (
+    get_dynamo_key,
+    item_cache_stats,
+    item_caches,
+    set_dynamo_item,
+)
 
 
 def test_org_lifecycle():
@@ -55,3 +63,60 @@ def test_org_lifecycle():
     assert (
         updated_org.beneficiario.convenio == update_fields["beneficiario"]["convenio"]
     )
+
+
+def test_reserve_nosso_numeros():
+    org = get_org()
+    assert org
+
+    first = reserve_nosso_numeros()
+    assert list(first) == [org.nossoNumero]
+
+    block = reserve_nosso_numeros(10)
+    assert list(block) == list(range(org.nossoNumero + 1, org.nossoNumero + 11))
+
+    updated_org = get_org()
+    assert updated_org
+    assert updated_org.nossoNumero == org.nossoNumero + 11
+
+    with pytest.raises(InvalidData):
+        reserve_nosso_numeros(0)
+
+
+def test_org_cache():
+    for cache in item_caches.values():
+        cache.clear()
+    org_cache = item_caches[EntityType.organization.value]
+
+    hits = org_cache.hits
+    org = get_org()
+    assert org
+    assert get_org() == org
+    assert org_cache.hits == hits + 1
+    assert 0 < item_cache_stats()["ORG"]["hitRate"] <= 1
+
+    # Increments drop the cached copy
+    reserve_nosso_numeros()
+    updated_org = get_org()
+    assert updated_org
+    assert updated_org.nossoNumero == org.nossoNumero + 1
+    assert updated_org.version == (org.version or 0) + 1
+
+    # Another process changes the org: the cached copy is served until a write
+    # based on it fails
+    key = get_dynamo_key(EntityType.organization, updated_org.orgId)
+    table.update_item(
+        Key=key,
+        UpdateExpression="ADD version :one",
+        ExpressionAttributeValues={":one": 1},
+    )
+    stale_org = get_org()
+    assert stale_org == updated_org
+    with pytest.raises(Conflict):
+        set_dynamo_item(stale_org.to_item())
+
+    fresh_org = get_org()
+    assert fresh_org
+    assert fresh_org.version == stale_org.version + 1
+    set_dynamo_item(fresh_org.to_item())
+    assert get_org().version == fresh_org.version + 1
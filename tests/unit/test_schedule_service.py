@@ -1,3 +1,6 @@
+import pytest
+
+from incc_shared.constants import EntityType
 from incc_shared.models.db.schedule import ScheduleModel
 from incc_shared.models.db.schedule.base import ScheduleStatus
 from incc_shared.models.request.schedule.update import UpdateScheduleModel
@@ -8,6 +11,11 @@ from incc_shared.service.schedule import (
     update_schedule,
 )
 from incc_shared.service.storage.base import to_model
+from incc_shared.service.storage.dynamodb import (
+    _compile_update_expression,
+    get_dynamo_key,
+    update_dynamo_item,
+)
 
 
 def test_schedule_lifecycle(
@@ -24,7 +32,7 @@ def test_schedule_lifecycle(
     schedule = get_schedule(test_schedule.id)
     assert schedule is not None
 
-    schedules = list_schedules()
+    schedules, _ = list_schedules()
     assert len(schedules) == 2
     ids = [test_schedule.id, test_schedule_balao.id]
     for s in schedules:
@@ -44,3 +52,30 @@ def test_schedule_lifecycle(
 
     delete_schedule(test_schedule.id)
     assert get_schedule(test_schedule.id) is None
+
+
+def test_update_expression_cache(test_schedule: ScheduleModel):
+    key = get_dynamo_key(EntityType.schedule, test_schedule.id)
+    update_schedule(test_schedule.id, UpdateScheduleModel(parcelasEmitidas=1))
+    hits = _compile_update_expression.cache_info().hits
+    schedule = update_schedule(
+        test_schedule.id, UpdateScheduleModel(parcelasEmitidas=2)
+    )
+    assert _compile_update_expression.cache_info().hits == hits + 1
+    assert schedule["parcelasEmitidas"] == 2
+    assert schedule["pagador"] == str(test_schedule.pagador)
+
+    result = update_dynamo_item(key, {"parcelasEmitidas": 3}, return_values="NONE")
+    assert result is None
+    updated = update_dynamo_item(
+        key, {"parcelasEmitidas": 4}, return_values="UPDATED_NEW"
+    )
+    assert updated["parcelasEmitidas"] == 4
+    assert "pagador" not in updated
+
+    schedule = get_schedule(test_schedule.id)
+    assert schedule.parcelasEmitidas == 4
+    assert schedule.version == (test_schedule.version or 0) + 4
+
+    with pytest.raises(ValueError):
+        update_dynamo_item(key, {"parcelasEmitidas": 5}, return_values="ALL_OLD")
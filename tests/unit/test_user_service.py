@@ -1,10 +1,24 @@
+import uuid
+from datetime import datetime, timedelta
+
 import pytest
+from freezegun import freeze_time
 
 from incc_shared.auth.context import get_context_entity, impersonate, set_context_entity
 from incc_shared.exceptions.errors import PermissionDenied
 from incc_shared.models.request.user.create import CreateUserModel
+from incc_shared.service import user as user_service
+from incc_shared.service.cache import TTLCache
 from incc_shared.service.organization import get_org
-from incc_shared.service.user import create_user, get_user, list_users
+from incc_shared.service.storage.base import table
+from incc_shared.service.user import (
+    create_user,
+    delete_user,
+    get_user,
+    get_user_by_username,
+    list_users,
+    user_cache_stats,
+)
 
 
 def test_user_lifecycle():
@@ -16,7 +30,7 @@ def test_user_lifecycle():
     assert user
     assert user.email == test_email
 
-    users = list_users()
+    users, _ = list_users()
     assert len(users) == 2
     found = False
     for u in users:
@@ -36,3 +50,41 @@ def test_user_lifecycle():
         set_context_entity(creator)
 
     # TODO: Update user
+
+
+def test_user_index_cache(monkeypatch):
+    monkeypatch.setattr(user_service, "user_index_cache", TTLCache(16, ttl=60))
+    monkeypatch.setattr(user_service, "user_index_queries", 0)
+
+    # Not registered yet
+    user = get_context_entity()
+    user_id = str(uuid.uuid4())
+    assert get_user_by_username(user_id) is None
+    table.put_item(
+        Item={
+            **user.to_item(),
+            "id": user_id,
+            "entity": f"USER#{user_id}",
+            "email": "jane.doe@example.com",
+            "gsi_user_pk": f"USER#{user_id}",
+            "gsi_org_sk": f"ORG#{user.orgId}",
+        }
+    )
+    assert get_user_by_username(user_id) is None
+    assert user_cache_stats()["gsiQueries"] == 1
+
+    # Negative entries are short lived
+    with freeze_time(datetime.now() + timedelta(seconds=10)):
+        found = get_user_by_username(user_id)
+        assert found
+        assert found.entity == f"USER#{user_id}"
+        assert get_user_by_username(user_id) == found
+
+    stats = user_cache_stats()
+    assert stats["gsiQueries"] == 2
+    assert stats["gsiQueriesSaved"] == 2
+    assert stats["hitRate"] == 0.5
+
+    delete_user(user_id)
+    assert get_user_by_username(user_id) is None
+    assert user_cache_stats()["gsiQueries"] == 3
@@ -0,0 +1,29 @@
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from incc_shared.service.calculator import formata_data_indice
+from incc_shared.service.utils import add_months, month_date, month_key, month_ordinal
+
+
+def test_add_months_parity():
+    # Every day of 35 years, stepped by the month offsets used in practice
+    inicio = date(1994, 1, 1)
+    fim = date(2029, 1, 1)
+    offsets = [-13, -1, 0, 1, 2, 3, 6, 11, 12, 59, 420]
+    dia = inicio
+    while dia < fim:
+        for months in offsets:
+            assert add_months(dia, months) == dia + relativedelta(months=months)
+        dia += timedelta(days=1)
+
+
+def test_month_key():
+    mes = date(1994, 1, 1)
+    for _ in range(35 * 12):
+        ordinal = month_ordinal(mes)
+        assert month_date(ordinal) == mes
+        assert month_key(ordinal) == formata_data_indice(mes)
+        mes += relativedelta(months=1)
+
+    assert month_date(month_ordinal(date(2024, 2, 1)), 31) == date(2024, 2, 29)